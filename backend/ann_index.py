@@ -0,0 +1,183 @@
+"""
+Approximate Nearest-Neighbour Index
+Pluggable candidate pre-selection for 1:N identification over the face gallery
+"""
+
+import os
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+# Below this many rows brute force is already sub-millisecond
+MIN_TRAIN_SIZE = 2048
+TRAIN_POINTS_PER_LIST = 32
+KMEANS_ITERATIONS = 10
+CHUNK_ROWS = 8192
+
+
+def _nearest_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Assign each vector to its nearest centroid, chunked to bound memory"""
+    c_norms = np.einsum('ij,ij->i', centroids, centroids)
+    out = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), CHUNK_ROWS):
+        chunk = vectors[start:start + CHUNK_ROWS]
+        # ||x||^2 is constant per row so it does not change the argmin
+        scores = c_norms - 2.0 * (chunk @ centroids.T)
+        out[start:start + CHUNK_ROWS] = np.argmin(scores, axis=1)
+    return out
+
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0) -> np.ndarray:
+    """Plain Lloyd's k-means returning (k x dim) float32 centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        labels = _nearest_centroids(vectors, centroids)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # Re-seed empty lists from random points so every list stays usable
+        if empty.any():
+            centroids[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()), replace=False)]
+    return centroids
+
+
+class GalleryIndex:
+    """Interface for candidate indexes over gallery rows"""
+
+    name = 'base'
+
+    @property
+    def is_trained(self) -> bool:
+        return False
+
+    def needs_training(self, size: int) -> bool:
+        return False
+
+    def train(self, matrix: np.ndarray):
+        pass
+
+    def add(self, row: int, vector: np.ndarray):
+        pass
+
+    def candidates(self, probe: np.ndarray) -> Optional[np.ndarray]:
+        """Return candidate row indices, or None to fall back to exact search"""
+        return None
+
+    def load(self, matrix: np.ndarray) -> bool:
+        return False
+
+
+class IVFFlatIndex(GalleryIndex):
+    """
+    Inverted-file index: k-means coarse quantizer with flat per-list row ids.
+
+    Distances are still computed exactly on the gallery rows of the nprobe
+    nearest lists, so nprobe is the recall-versus-latency knob: nprobe == nlist
+    is exact search, small nprobe scans roughly nprobe / nlist of the gallery.
+    Only the centroids are persisted; row assignments are recomputed on load.
+    """
+
+    name = 'ivf'
+
+    def __init__(self, nprobe: int = 8, nlist: Optional[int] = None, path: Optional[Path] = None):
+        self.nprobe = nprobe
+        self.nlist = nlist
+        self.path = Path(path) if path else None
+        self.centroids = None
+        self.trained_size = 0
+        self._assignments = {}
+        self._lists: List[list] = []
+        self._cache: List[Optional[np.ndarray]] = []
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def needs_training(self, size: int) -> bool:
+        if size < MIN_TRAIN_SIZE:
+            return False
+        # Retrain whenever the gallery has doubled since the last training
+        return not self.is_trained or size >= 2 * self.trained_size
+
+    def train(self, matrix: np.ndarray):
+        nlist = self.nlist or max(16, int(np.sqrt(len(matrix))))
+        sample_size = min(len(matrix), nlist * TRAIN_POINTS_PER_LIST)
+        sample = matrix[np.random.default_rng(0).choice(len(matrix), size=sample_size, replace=False)]
+        self._set_centroids(kmeans(np.asarray(sample, dtype=np.float32), nlist), matrix)
+        self.save()
+
+    def _set_centroids(self, centroids: np.ndarray, matrix: np.ndarray):
+        self.centroids = centroids
+        self.trained_size = len(matrix)
+        labels = _nearest_centroids(matrix, centroids) if len(matrix) else np.empty(0, dtype=np.int32)
+        self._assignments = dict(enumerate(labels.tolist()))
+        order = np.argsort(labels, kind='stable')
+        bounds = np.searchsorted(labels[order], np.arange(len(centroids) + 1))
+        self._lists = [order[bounds[i]:bounds[i + 1]].tolist() for i in range(len(centroids))]
+        self._cache = [None] * len(centroids)
+
+    def add(self, row: int, vector: np.ndarray):
+        if not self.is_trained:
+            return
+        label = int(_nearest_centroids(vector.reshape(1, -1), self.centroids)[0])
+        previous = self._assignments.get(row)
+        if previous == label:
+            return
+        if previous is not None:
+            self._lists[previous].remove(row)
+            self._cache[previous] = None
+        self._assignments[row] = label
+        self._lists[label].append(row)
+        self._cache[label] = None
+
+    def _list_rows(self, label: int) -> np.ndarray:
+        rows = self._cache[label]
+        if rows is None:
+            rows = np.array(self._lists[label], dtype=np.int64)
+            self._cache[label] = rows
+        return rows
+
+    def candidates(self, probe: np.ndarray) -> Optional[np.ndarray]:
+        if not self.is_trained:
+            return None
+        scores = np.einsum('ij,ij->i', self.centroids, self.centroids) - 2.0 * (self.centroids @ probe)
+        nprobe = min(self.nprobe, len(self.centroids))
+        probed = np.argpartition(scores, nprobe - 1)[:nprobe]
+        return np.concatenate([self._list_rows(int(label)) for label in probed])
+
+    def save(self):
+        if self.path is None or not self.is_trained:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Other processes may be loading the file; replace it atomically, as GallerySnapshot.write does
+        tmp_path = self.path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, centroids=self.centroids, trained_size=self.trained_size)
+        os.replace(tmp_path, self.path)
+
+    def load(self, matrix: np.ndarray) -> bool:
+        """Restore saved centroids and assign the current gallery rows to them"""
+        if self.path is None or not self.path.exists():
+            return False
+        with np.load(self.path) as data:
+            centroids = data['centroids']
+            trained_size = int(data['trained_size'])
+        if centroids.shape[1] != matrix.shape[1]:
+            return False
+        self._set_centroids(centroids.astype(np.float32), matrix)
+        self.trained_size = trained_size
+        return True
+
+
+def make_index(kind: str, nprobe: int = 8, path: Optional[Path] = None) -> Optional[GalleryIndex]:
+    """Create the candidate index named by ANN_INDEX ('exact' disables it)"""
+    kind = (kind or 'exact').lower()
+    if kind == 'exact':
+        return None
+    if kind == 'ivf':
+        return IVFFlatIndex(nprobe=nprobe, path=path)
+    raise ValueError(f"Unknown ANN index type: {kind}")
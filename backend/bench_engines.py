@@ -0,0 +1,183 @@
+"""
+bench_engines.py - Face Engine Comparison
+
+Runs the same labelled photos through every available face engine
+(face_engines.py) and reports, per engine:
+
+- model load time and per-stage latency (detect, encode, total) from extract_face
+- failure-to-process rate by reason (no_face, multiple_faces, ...)
+- 1:1 false-reject and false-accept rates at the tolerance
+- 1:N rank-1 identification accuracy against a gallery of everyone's first photo
+
+Photos are laid out one directory per person, as in LFW:
+<photos>/<person>/<any name>.jpg. The first usable photo of each person is
+enrolled, the rest are probes, so people need at least two photos to count
+towards FRR and identification. The synthetic engine is included as a
+latency baseline; its accuracy on real photos means nothing.
+
+Pick the engine for a deployment with FACE_ENGINE=dlib|opencv in app.py's
+environment; the opencv engine reads its models from FACE_MODEL_DIR.
+
+Run with: python bench_engines.py --photos ~/faces [--engines dlib opencv synthetic]
+                                  [--tolerance 0.6] [--output engine_report.json]
+"""
+
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from face_engines import ENGINE_NAMES, get_engine, resolve_engine_name
+from face_gallery import FaceGallery
+from face_pipeline import PipelineSettings, extract_face
+
+PHOTO_SUFFIXES = ('.jpg', '.jpeg', '.png')
+STAGES = ('detect', 'encode', 'total')
+
+
+def load_photos(directory: Path) -> dict:
+    """{person: [image bytes, ...]} for every person directory with at least one photo"""
+    people = {}
+    for person in sorted(path for path in directory.iterdir() if path.is_dir()):
+        photos = [path.read_bytes() for path in sorted(person.iterdir()) if path.suffix.lower() in PHOTO_SUFFIXES]
+        if photos:
+            people[person.name] = photos
+    return people
+
+
+def available_engines(model_dir: str, requested: list = None) -> list:
+    engines = []
+    for name in requested or ENGINE_NAMES:
+        if name == 'auto':
+            continue
+        try:
+            resolve_engine_name(name, model_dir)
+        except RuntimeError as e:
+            print(f"   ⚠️ Skipping {name}: {e}")
+            continue
+        engines.append(name)
+    return engines
+
+
+def stage_percentiles(samples: list) -> dict:
+    if not samples:
+        return {}
+    return {
+        "p50": round(float(np.percentile(samples, 50)), 2),
+        "p95": round(float(np.percentile(samples, 95)), 2)
+    }
+
+
+def evaluate_engine(name: str, people: dict, settings: PipelineSettings, tolerance: float) -> dict:
+    start = time.perf_counter()
+    get_engine(settings.engine, settings.synthetic_latency_ms, settings.model_dir)
+    load_ms = (time.perf_counter() - start) * 1000
+
+    timings = {stage: [] for stage in STAGES}
+    failures = {}
+    encodings = {}
+    photos = 0
+    for person, images in people.items():
+        for image_bytes in images:
+            photos += 1
+            face = extract_face(image_bytes, settings)
+            for stage in STAGES:
+                if stage in face["timings"]:
+                    timings[stage].append(face["timings"][stage])
+            if face["ok"]:
+                encodings.setdefault(person, []).append(face["encoding"])
+            else:
+                failures[face["reason"]] = failures.get(face["reason"], 0) + 1
+
+    gallery = FaceGallery(capacity=len(encodings))
+    for person, faces in encodings.items():
+        gallery.set_templates(person, person, [faces[0]])
+
+    genuine = rejects = impostor = accepts = identified = 0
+    enrolled = list(encodings)
+    for person, faces in encodings.items():
+        for probe in faces[1:]:
+            genuine += 1
+            rejects += gallery.verify(person, probe) >= tolerance
+            student_id, _, distance = gallery.best_match(probe)
+            identified += student_id == person and distance < tolerance
+            for other in enrolled:
+                if other != person:
+                    impostor += 1
+                    accepts += gallery.verify(other, probe) < tolerance
+
+    return {
+        "engine": name,
+        "loadMs": round(load_ms, 1),
+        "photos": photos,
+        "failures": failures,
+        "failureRate": round(sum(failures.values()) / photos, 4) if photos else None,
+        "latencyMs": {stage: stage_percentiles(samples) for stage, samples in timings.items()},
+        "genuineProbes": genuine,
+        "impostorProbes": impostor,
+        "frr": round(rejects / genuine, 4) if genuine else None,
+        "far": round(accepts / impostor, 4) if impostor else None,
+        "rank1": round(identified / genuine, 4) if genuine else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare latency and accuracy of the face engines")
+    parser.add_argument('--photos', type=Path, required=True,
+                        help="directory with one sub-directory of photos per person")
+    parser.add_argument('--engines', nargs='+', choices=[name for name in ENGINE_NAMES if name != 'auto'],
+                        help="engines to compare (default: every one that is installed)")
+    parser.add_argument('--model-dir', default=os.getenv('FACE_MODEL_DIR', str(Path(__file__).parent / 'models')),
+                        help="directory with the opencv engine's ONNX models")
+    parser.add_argument('--tolerance', type=float, default=float(os.getenv('FACE_RECOGNITION_TOLERANCE', '0.6')))
+    parser.add_argument('--output', type=Path, default=Path('engine_report.json'))
+    args = parser.parse_args()
+
+    print("🚀 FACE ENGINE COMPARISON")
+    print("=" * 78)
+
+    people = load_photos(args.photos)
+    if not people:
+        print(f"❌ No <person>/<photo>.jpg directories under {args.photos}")
+        return
+    engines = available_engines(args.model_dir, args.engines)
+    if not engines:
+        print("❌ None of the requested engines is available")
+        return
+    print(f"📊 {len(people)} people, {sum(len(images) for images in people.values())} photos, "
+          f"tolerance {args.tolerance}, engines: {', '.join(engines)}")
+
+    results = []
+    print(f"\n   {'engine':>9} {'load':>8} {'detect p50':>11} {'encode p50':>11} {'total p50':>11} "
+          f"{'total p95':>11} {'fail':>7} {'FRR':>7} {'FAR':>7} {'rank-1':>7}")
+    for name in engines:
+        settings = PipelineSettings(engine=name, model_dir=args.model_dir)
+        result = evaluate_engine(name, people, settings, args.tolerance)
+        results.append(result)
+        latency = result["latencyMs"]
+
+        def ms(stage, key='p50'):
+            value = latency[stage].get(key)
+            return f"{value:8.1f} ms" if value is not None else f"{'-':>11}"
+
+        def rate(key):
+            value = result[key]
+            return f"{value:7.2%}" if value is not None else f"{'-':>7}"
+
+        print(f"   {name:>9} {result['loadMs']:5.0f} ms {ms('detect')} {ms('encode')} {ms('total')} "
+              f"{ms('total', 'p95')} {rate('failureRate')} {rate('frr')} {rate('far')} {rate('rank1')}")
+
+    args.output.write_text(json.dumps({
+        "photos": str(args.photos),
+        "people": len(people),
+        "tolerance": args.tolerance,
+        "engines": results
+    }, indent=2))
+    print(f"\n✅ Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
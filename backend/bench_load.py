@@ -0,0 +1,268 @@
+"""
+bench_load.py - In-Process Load Test
+
+Starts app.py in this process against a scratch data directory and drives
+concurrent verify, enroll and report traffic through httpx's ASGI transport
+(no sockets, no live server). Arrivals are open-loop Poisson at the given
+rates, so latency includes queueing when the server falls behind.
+
+Without face_recognition installed, app.py runs the synthetic face engine on
+synthetic frames: each frame is enrolled for one student and verify requests
+present it again, so matching does real work against the whole gallery.
+--detect-ms/--encode-ms give that engine a realistic CPU cost. With dlib,
+pass --photos with real <studentId>.jpg face photos, or most requests will
+end in no_face.
+
+Writes throughput and latency percentiles per request kind, plus the
+server's own per-stage quantiles from /metrics, as JSON.
+
+Install with: pip install -r requirements-dev.txt
+
+Run with: python bench_load.py [--students 500] [--duration 30] [--verify-rate 20]
+                               [--enroll-rate 1] [--report-rate 0.5] [--output load_report.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+KINDS = ('verify', 'enroll', 'report')
+
+
+def synthetic_frame(rng: np.random.Generator, width: int, height: int) -> bytes:
+    """A textured JPEG that passes the brightness/blur gate"""
+    import cv2
+    frame = np.clip(rng.normal(128, 50, size=(height, width, 3)), 0, 255).astype(np.uint8)
+    return cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes()
+
+
+def seed_roster(app, students: int, seed: int, frames: list) -> list:
+    """
+    Insert students directly, then load the gallery once
+
+    Student i is enrolled from frames[i] through the face engine, so verifying
+    with that frame matches; the rest of the roster gets random encodings.
+    """
+    rng = np.random.default_rng(seed)
+    roster = [(f"LOAD{i:06d}", f"Load Student {i}") for i in range(max(students, len(frames)))]
+    with app.db_pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany('''
+            INSERT OR REPLACE INTO students (student_id, name, grade, has_face_encoding)
+            VALUES (?, ?, 'LOAD', 1)
+        ''', roster)
+        for i, (student_id, _) in enumerate(roster):
+            face = app.extract_face(frames[i], app.FACE_PIPELINE_SETTINGS) if i < len(frames) else None
+            if face and face["ok"]:
+                encoding = face["encoding"]
+            else:
+                encoding = rng.normal(size=app.ENCODING_DIM) * 0.1
+            app.save_encoding(cursor, student_id, encoding)
+        conn.commit()
+    app.face_gallery = app.load_encodings()
+    return roster
+
+
+def percentiles(latencies: list) -> dict:
+    if not latencies:
+        return {}
+    values = np.array(latencies) * 1000
+    return {
+        "p50": round(float(np.percentile(values, 50)), 2),
+        "p95": round(float(np.percentile(values, 95)), 2),
+        "p99": round(float(np.percentile(values, 99)), 2),
+        "max": round(float(values.max()), 2)
+    }
+
+
+class LoadRun:
+    """Open-loop traffic generator for one request kind per task"""
+
+    def __init__(self, client, args, roster: list, frames: list):
+        self.client = client
+        self.args = args
+        self.roster = roster
+        self.frames = frames
+        self.random = random.Random(args.seed)
+        self.latencies = {kind: [] for kind in KINDS}
+        self.statuses = {kind: {} for kind in KINDS}
+        self.dropped = {kind: 0 for kind in KINDS}
+        self.in_flight = 0
+        self.enrolled = 0
+        self.tasks = set()
+
+    async def request(self, kind: str):
+        self.in_flight += 1
+        start = time.perf_counter()
+        try:
+            if kind == 'verify':
+                index = self.random.randrange(len(self.frames))
+                student_id, name = self.roster[index]
+                response = await self.client.post(
+                    '/api/verify-face', params={"studentId": student_id, "studentName": name},
+                    content=self.frames[index], headers={"content-type": "image/jpeg"}
+                )
+            elif kind == 'enroll':
+                self.enrolled += 1
+                response = await self.client.post(
+                    '/api/admin/upload-student-photo',
+                    params={"studentId": f"NEW{self.enrolled:06d}", "studentName": f"New Student {self.enrolled}"},
+                    content=self.random.choice(self.frames), headers={"content-type": "image/jpeg"}
+                )
+            else:
+                response = await self.client.get('/api/attendance/report', params={"limit": 500})
+            status = str(response.status_code)
+        except Exception as e:
+            status = type(e).__name__
+        finally:
+            self.in_flight -= 1
+
+        self.latencies[kind].append(time.perf_counter() - start)
+        self.statuses[kind][status] = self.statuses[kind].get(status, 0) + 1
+
+    async def arrivals(self, kind: str, rate: float, deadline: float):
+        rng = random.Random(f"{self.args.seed}-{kind}")
+        while rate > 0:
+            await asyncio.sleep(rng.expovariate(rate))
+            if time.perf_counter() >= deadline:
+                return
+            if self.in_flight >= self.args.max_in_flight:
+                self.dropped[kind] += 1
+                continue
+            task = asyncio.create_task(self.request(kind))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def run(self) -> float:
+        rates = {'verify': self.args.verify_rate, 'enroll': self.args.enroll_rate, 'report': self.args.report_rate}
+        start = time.perf_counter()
+        deadline = start + self.args.duration
+        await asyncio.gather(*(self.arrivals(kind, rate, deadline) for kind, rate in rates.items()))
+        if self.tasks:
+            await asyncio.gather(*self.tasks)
+        return time.perf_counter() - start
+
+
+async def run_load(app, args, roster: list, frames: list) -> dict:
+    import httpx
+
+    transport = httpx.ASGITransport(app=app.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        # One warm-up request so worker start-up is not billed to the first real one
+        await client.post('/api/verify-face', params={"studentId": roster[0][0], "studentName": roster[0][1]},
+                          content=frames[0], headers={"content-type": "image/jpeg"})
+        load = LoadRun(client, args, roster, frames)
+        elapsed = await load.run()
+
+    return {
+        "elapsedSeconds": round(elapsed, 2),
+        "kinds": {
+            kind: {
+                "requests": len(load.latencies[kind]),
+                "throughputPerSecond": round(len(load.latencies[kind]) / elapsed, 2),
+                "statuses": load.statuses[kind],
+                "dropped": load.dropped[kind],
+                "latencyMs": percentiles(load.latencies[kind])
+            }
+            for kind in KINDS
+        },
+        "serverStagesMs": {
+            labels[0]: {key: round(value * 1000, 3) if key != "count" else value for key, value in stats.items()}
+            for labels, stats in app.metrics.quantiles(app.STAGE_SECONDS).items()
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process load test of the attendance API")
+    parser.add_argument('--students', type=int, default=500, help="roster size seeded before the run")
+    parser.add_argument('--duration', type=float, default=30, help="seconds of traffic")
+    parser.add_argument('--verify-rate', type=float, default=20, help="verify requests per second")
+    parser.add_argument('--enroll-rate', type=float, default=1, help="enrollments per second")
+    parser.add_argument('--report-rate', type=float, default=0.5, help="report requests per second")
+    parser.add_argument('--max-in-flight', type=int, default=256, help="arrivals beyond this are dropped")
+    parser.add_argument('--frame-size', default='1280x720', help="synthetic frame WIDTHxHEIGHT")
+    parser.add_argument('--frames', type=int, default=32, help="distinct synthetic frames to cycle through")
+    parser.add_argument('--photos', type=Path, help="directory of <studentId>.jpg photos to enroll and probe with")
+    parser.add_argument('--detect-ms', type=float, default=0, help="synthetic engine CPU time per detection")
+    parser.add_argument('--encode-ms', type=float, default=0, help="synthetic engine CPU time per encoding")
+    parser.add_argument('--cache', action='store_true', help="keep the encoding cache on (repeated frames hit it)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=Path, default=Path('load_report.json'))
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix='attendance-load-')
+    os.environ['ATTENDANCE_DATA_DIR'] = data_dir
+    if not args.cache:
+        os.environ['ENCODING_CACHE_BYTES'] = '0'
+    os.environ['SYNTHETIC_DETECT_MS'] = str(args.detect_ms)
+    os.environ['SYNTHETIC_ENCODE_MS'] = str(args.encode_ms)
+    sys.path.insert(0, str(Path(__file__).parent))
+    import app
+
+    print("🚀 IN-PROCESS LOAD TEST")
+    print("=" * 70)
+
+    rng = np.random.default_rng(args.seed)
+    if args.photos:
+        frames = []
+        roster = []
+        for photo in sorted(args.photos.glob('*.jpg')):
+            frame = photo.read_bytes()
+            face = app.extract_face(frame)
+            if not face["ok"]:
+                print(f"   ⚠️ {photo.name}: {face['message']}")
+                continue
+            app.enroll_student(app.StudentPhotoFields(studentId=photo.stem, studentName=photo.stem),
+                               frame, face["encoding"])
+            frames.append(frame)
+            roster.append((photo.stem, photo.stem))
+        if not roster:
+            print("❌ No usable photos")
+            return
+    else:
+        width, height = (int(side) for side in args.frame_size.lower().split('x'))
+        frames = [synthetic_frame(rng, width, height) for _ in range(args.frames)]
+        roster = seed_roster(app, args.students, args.seed, frames)
+
+    engine = app.FACE_ENGINE
+    print(f"📊 {len(roster):,} students, engine={engine}, {app.FACE_WORKERS} face workers, "
+          f"data in {data_dir}")
+    print(f"⚙️  verify {args.verify_rate}/s, enroll {args.enroll_rate}/s, report {args.report_rate}/s "
+          f"for {args.duration:.0f} s")
+
+    result = asyncio.run(run_load(app, args, roster, frames))
+
+    for kind, stats in result["kinds"].items():
+        latency = stats["latencyMs"]
+        if not stats["requests"]:
+            continue
+        print(f"   {kind:>7}: {stats['requests']:>6} req  {stats['throughputPerSecond']:>7.1f}/s  "
+              f"p50 {latency['p50']:>8.1f} ms  p95 {latency['p95']:>8.1f} ms  p99 {latency['p99']:>8.1f} ms  "
+              f"{stats['statuses']}" + (f"  ⚠️ dropped {stats['dropped']}" if stats['dropped'] else ""))
+
+    report = {
+        "startedAt": datetime.now().isoformat(),
+        "engine": engine,
+        "config": {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()},
+        "students": len(roster),
+        "faceWorkers": app.FACE_WORKERS,
+        **result
+    }
+    args.output.write_text(json.dumps(report, indent=2))
+    shutil.rmtree(data_dir, ignore_errors=True)
+    print(f"\n✅ Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+bench_micro.py - Recognition Core Micro-Benchmarks
+
+pytest-benchmark suite for the hot paths behind a check-in, on synthetic
+data only (no camera, network or dlib):
+
+- decode_base64_image on VGA, 720p and 1080p frames
+- 1:N best_match and 1:1 verify against galleries of 100 to 100k students
+- load_encodings from the snapshot and as a full rebuild, and save_encoding
+- build_report_query and one keyset page of the attendance report
+
+Runs are stored under .benchmarks/ next to this file. Save a baseline
+before a performance change and compare against it afterwards.
+
+Install with: pip install -r requirements-dev.txt
+
+Run with: python bench_micro.py --save baseline
+          python bench_micro.py --compare            (against the latest saved run)
+          python bench_micro.py -k "best_match and 100000"   (any pytest option works)
+"""
+
+import argparse
+import base64
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+# Same scratch data directory as the tests, also when run as a script
+import conftest  # noqa: F401
+import app
+from db_pool import SQLitePool
+from face_gallery import ENCODING_DIM, FaceGallery, GallerySnapshot
+
+BENCHMARK_DIR = Path(__file__).parent / '.benchmarks'
+GALLERY_SIZES = (100, 1000, 10000, 100000)
+IMAGE_SIZES = {"vga": (640, 480), "720p": (1280, 720), "1080p": (1920, 1080)}
+REPORT_DAYS = 180
+
+
+def synthetic_encodings(n: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).normal(size=(n, ENCODING_DIM)) * 0.1
+
+
+@pytest.fixture(scope="module", params=list(IMAGE_SIZES))
+def base64_frame(request) -> str:
+    """A camera-like frame as the frontend sends it: a JPEG data URL"""
+    width, height = IMAGE_SIZES[request.param]
+    frame = np.clip(np.random.default_rng(0).normal(128, 50, size=(height, width, 3)), 0, 255).astype(np.uint8)
+    jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])[1].tobytes()
+    return "data:image/jpeg;base64," + base64.b64encode(jpeg).decode('ascii')
+
+
+@pytest.fixture(scope="module", params=GALLERY_SIZES)
+def gallery(request) -> tuple:
+    """(gallery, probe close to a known student, that student's ID)"""
+    n = request.param
+    matrix = synthetic_encodings(n).astype(np.float32)
+    ids = [f"S{i:06d}" for i in range(n)]
+    gallery = FaceGallery.from_arrays(ids, {student_id: student_id for student_id in ids}, matrix)
+    target = n // 2
+    probe = matrix[target] + np.random.default_rng(1).normal(size=ENCODING_DIM).astype(np.float32) * 0.01
+    return gallery, probe, ids[target]
+
+
+@pytest.fixture(scope="module", params=GALLERY_SIZES)
+def encoding_store(request, tmp_path_factory) -> int:
+    """
+    Point app.py at a database with n enrolled students and n attendance rows
+
+    Swaps app.db_pool and app.gallery_snapshot for the module, since
+    load_encodings and save_encoding work on those globals.
+    """
+    n = request.param
+    directory = tmp_path_factory.mktemp(f"store_{n}")
+    pool = SQLitePool(directory / 'attendance.db', size=2)
+    encodings = synthetic_encodings(n)
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        app.create_tables(cursor)
+        app.migrate_schema(cursor)
+        cursor.executemany('''
+            INSERT INTO students (student_id, name, has_face_encoding) VALUES (?, ?, 1)
+        ''', [(f"S{i:06d}", f"Student {i}") for i in range(n)])
+        cursor.executemany('''
+            INSERT INTO face_encodings (student_id, encoding) VALUES (?, ?)
+        ''', [(f"S{i:06d}", encoding.tobytes()) for i, encoding in enumerate(encodings)])
+        cursor.executemany('''
+            INSERT INTO attendance (student_id, student_name, date, check_in_time, confidence_score)
+            VALUES (?, ?, date('2026-01-01', ? || ' days'), ?, 90.0)
+        ''', [(f"S{i:06d}", f"Student {i}", f"+{i % REPORT_DAYS}", f"08:{i % 60:02d}:00") for i in range(n)])
+        conn.commit()
+
+    saved = app.db_pool, app.gallery_snapshot
+    app.db_pool, app.gallery_snapshot = pool, GallerySnapshot(directory / 'face_gallery.f32')
+    yield n
+    app.db_pool, app.gallery_snapshot = saved
+    pool.close()
+
+
+def test_decode_base64_image(benchmark, base64_frame):
+    image = benchmark(app.decode_base64_image, base64_frame)
+    assert image.ndim == 3
+
+
+def test_best_match(benchmark, gallery):
+    faces, probe, expected = gallery
+    student_id, _, _ = benchmark(faces.best_match, probe)
+    assert student_id == expected
+
+
+def test_verify(benchmark, gallery):
+    faces, probe, expected = gallery
+    distance = benchmark(faces.verify, expected, probe)
+    assert distance < app.FACE_MATCH_TOLERANCE
+
+
+def test_load_encodings_snapshot(benchmark, encoding_store):
+    app.load_encodings()
+    loaded = benchmark(app.load_encodings)
+    assert len(loaded) == encoding_store
+
+
+def test_load_encodings_rebuild(benchmark, encoding_store):
+    loaded = benchmark.pedantic(app.load_encodings, setup=app.gallery_snapshot.invalidate, rounds=3)
+    assert len(loaded) == encoding_store
+
+
+def test_save_encoding(benchmark, encoding_store):
+    encoding = synthetic_encodings(1, seed=2)[0]
+
+    def save():
+        with app.db_pool.connection() as conn:
+            app.save_encoding(conn.cursor(), "S000000", encoding)
+            conn.commit()
+
+    benchmark(save)
+
+
+def test_build_report_query(benchmark):
+    query, params = benchmark(app.build_report_query, '2026-01-01', '2026-03-31', 'S000042',
+                              ['2026-02-01', '08:00:00', 10 ** 9], 500)
+    assert len(params) == 7
+
+
+def test_report_page(benchmark, encoding_store):
+    query, params = app.build_report_query(start_date='2026-02-01', end_date='2026-04-30', limit=500)
+
+    def page():
+        with app.db_pool.connection() as conn:
+            return conn.execute(query, params).fetchall()
+
+    rows = benchmark(page)
+    assert rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the recognition core micro-benchmarks")
+    parser.add_argument('--save', metavar='NAME', help="store this run under .benchmarks/ as NAME")
+    parser.add_argument('--compare', nargs='?', const='', metavar='RUN',
+                        help="compare against a saved run (default: the latest one)")
+    args, pytest_args = parser.parse_known_args()
+
+    try:
+        import pytest_benchmark  # noqa: F401
+    except ImportError:
+        print("❌ pytest-benchmark is not installed: pip install -r requirements-dev.txt")
+        return 1
+
+    options = [
+        __file__, '-q',
+        f'--benchmark-storage=file://{BENCHMARK_DIR}',
+        '--benchmark-columns=min,median,mean,ops,rounds',
+        '--benchmark-sort=fullname'
+    ]
+    if args.save:
+        options.append(f'--benchmark-save={args.save}')
+    if args.compare is not None:
+        options.append(f'--benchmark-compare={args.compare}' if args.compare else '--benchmark-compare')
+    return pytest.main(options + pytest_args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
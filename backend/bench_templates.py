@@ -0,0 +1,109 @@
+"""
+bench_templates.py - Templates per Student Benchmark
+
+Simulates students photographed under several classroom lighting conditions
+and measures, for K = 1..8 templates per student, the false-reject rate
+(genuine 1:1 probes over the tolerance), the false-accept rate (impostor
+probes under it) and verify / 1:N latency, in both 'min' and 'centroid'
+matching modes. Synthetic identities are well separated, so FAR here is a
+sanity check that more templates do not open the gallery up, not an estimate
+of real-world false accepts.
+
+Run with: python bench_templates.py [--students 2000] [--k 1 2 3 5 8] [--tolerance 0.6]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from face_gallery import ENCODING_DIM, FaceGallery, MATCH_MODES
+
+CONDITIONS = 6
+PROBES = 2000
+# Per-dimension spreads, chosen so same-condition captures land around 0.3 apart,
+# cross-condition captures around 0.6 and different students around 0.85
+IDENTITY_STD = 0.038
+CONDITION_STD = 0.032
+CAPTURE_STD = 0.019
+
+
+class SyntheticSchool:
+    """Students whose captures depend on identity, lighting condition and noise"""
+
+    def __init__(self, students: int, seed: int = 0):
+        self.rng = np.random.default_rng(seed)
+        self.identities = self.rng.normal(size=(students, ENCODING_DIM)) * IDENTITY_STD
+        self.conditions = self.rng.normal(size=(students, CONDITIONS, ENCODING_DIM)) * CONDITION_STD
+
+    def capture(self, student: int, condition: int = None) -> np.ndarray:
+        if condition is None:
+            condition = self.rng.integers(CONDITIONS)
+        noise = self.rng.normal(size=ENCODING_DIM) * CAPTURE_STD
+        return (self.identities[student] + self.conditions[student, condition] + noise).astype(np.float32)
+
+
+def build_gallery(school: SyntheticSchool, k: int, mode: str) -> FaceGallery:
+    """Enroll every student with k captures under random conditions"""
+    gallery = FaceGallery(capacity=len(school.identities) * k, match_mode=mode)
+    for student in range(len(school.identities)):
+        templates = [school.capture(student) for _ in range(k)]
+        gallery.set_templates(f"S{student:06d}", f"Student {student}", templates)
+    return gallery
+
+
+def evaluate(gallery: FaceGallery, school: SyntheticSchool, tolerance: float) -> dict:
+    rng = np.random.default_rng(1)
+    students = len(school.identities)
+    genuine = rng.integers(0, students, size=PROBES)
+    impostor_claims = (genuine + rng.integers(1, students, size=PROBES)) % students
+
+    rejects = accepts = 0
+    verify_ms = []
+    identify_ms = []
+    for student, claimed in zip(genuine, impostor_claims):
+        probe = school.capture(int(student))
+
+        start = time.perf_counter()
+        distance = gallery.verify(f"S{student:06d}", probe)
+        verify_ms.append((time.perf_counter() - start) * 1000)
+        rejects += distance >= tolerance
+
+        accepts += gallery.verify(f"S{claimed:06d}", probe) < tolerance
+
+        start = time.perf_counter()
+        gallery.best_match(probe)
+        identify_ms.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "frr": rejects / PROBES,
+        "far": accepts / PROBES,
+        "verify_p50": np.percentile(verify_ms, 50),
+        "identify_p50": np.percentile(identify_ms, 50),
+        "identify_p95": np.percentile(identify_ms, 95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark false rejects and latency against templates per student")
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--k', type=int, nargs='+', default=[1, 2, 3, 5, 8])
+    parser.add_argument('--tolerance', type=float, default=0.6)
+    args = parser.parse_args()
+
+    print("🚀 TEMPLATES PER STUDENT BENCHMARK")
+    print("=" * 78)
+    print(f"📊 {args.students:,} students, {CONDITIONS} lighting conditions, tolerance {args.tolerance}")
+
+    school = SyntheticSchool(args.students)
+    for mode in MATCH_MODES:
+        print(f"\n   mode={mode}")
+        print(f"   {'K':>3} {'FRR':>7} {'FAR':>7} {'verify p50':>12} {'1:N p50':>10} {'1:N p95':>10}")
+        for k in args.k:
+            result = evaluate(build_gallery(school, k, mode), school, args.tolerance)
+            print(f"   {k:>3} {result['frr']:7.2%} {result['far']:7.2%} "
+                  f"{result['verify_p50']:9.4f} ms {result['identify_p50']:7.3f} ms {result['identify_p95']:7.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
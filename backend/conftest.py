@@ -0,0 +1,15 @@
+"""
+Shared pytest setup for the backend tests
+
+app.py opens its database and gallery on import, so point it at a scratch
+data directory before any test module imports it, and run the face
+pipeline and bulk enrollment in-process (FACE_WORKERS=0,
+BULK_ENROLL_WORKERS=0) so tests do not start worker pools.
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault('ATTENDANCE_DATA_DIR', tempfile.mkdtemp(prefix='attendance-test-'))
+os.environ.setdefault('FACE_WORKERS', '0')
+os.environ.setdefault('BULK_ENROLL_WORKERS', '0')
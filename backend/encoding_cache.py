@@ -0,0 +1,84 @@
+"""
+Encoding Cache
+Content-addressed LRU cache of face pipeline results with a byte budget
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+import numpy as np
+
+# Rough per-entry cost of the dict, key, tuple and OrderedDict link beyond the encoding itself
+ENTRY_OVERHEAD_BYTES = 512
+CACHED_FIELDS = ("ok", "reason", "message", "encoding", "location")
+
+
+class EncodingCache:
+    """
+    Maps a hash of the uploaded image bytes to the extract_face result.
+
+    extract_face is a pure function of the bytes and the pipeline settings,
+    so entries never go stale; the least recently used ones are evicted once
+    the estimated size exceeds max_bytes. Failures such as no_face are cached
+    too, since resubmitting the same bytes cannot change them.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def _entry_size(result: dict) -> int:
+        encoding = result.get("encoding")
+        return ENTRY_OVERHEAD_BYTES + (encoding.nbytes if isinstance(encoding, np.ndarray) else 0)
+
+    def get(self, key: Hashable) -> Optional[dict]:
+        """Return a copy of the cached result, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return dict(entry[0])
+
+    def put(self, key: Hashable, result: dict):
+        if self.max_bytes <= 0:
+            return
+        cached = {field: result[field] for field in CACHED_FIELDS if field in result}
+        size = self._entry_size(cached)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (cached, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0
+            }
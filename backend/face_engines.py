@@ -0,0 +1,238 @@
+"""
+Face Engines
+Interchangeable face detectors/encoders behind one small interface
+
+face_pipeline.py decodes, downscales and quality-gates a frame, then asks
+the engine for face boxes and one encoding. Engines are built once per
+process by get_engine() and must stay importable without app.py, since they
+run inside ProcessPoolExecutor workers.
+"""
+
+import time
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import cv2
+
+# Try to import face recognition, but handle gracefully if not available
+try:
+    import face_recognition
+    FACE_RECOGNITION_AVAILABLE = True
+except ImportError:
+    FACE_RECOGNITION_AVAILABLE = False
+
+ENGINE_NAMES = ('auto', 'dlib', 'opencv', 'synthetic')
+
+# OpenCV Zoo models for the 'opencv' engine, looked up in the model directory:
+# https://github.com/opencv/opencv_zoo/tree/main/models/face_detection_yunet
+# https://github.com/opencv/opencv_zoo/tree/main/models/face_recognition_sface
+MODEL_DIR = Path(__file__).parent / 'models'
+YUNET_MODEL_FILE = 'face_detection_yunet_2023mar.onnx'
+SFACE_MODEL_FILE = 'face_recognition_sface_2021dec.onnx'
+YUNET_SCORE_THRESHOLD = 0.9
+YUNET_NMS_THRESHOLD = 0.3
+# Margin around a detected box when re-locating landmarks on the encoding frame
+YUNET_CROP_MARGIN = 0.25
+# SFace features are L2-normalised and scaled so OpenCV's recommended L2 match
+# threshold (1.128, cosine 0.363) lands on the gallery's default 0.6 tolerance,
+# keeping FACE_RECOGNITION_TOLERANCE and the template distances engine-neutral
+SFACE_SCALE = 0.6 / 1.128
+
+# Synthetic embeddings: a 16x16 grayscale thumbnail of the face box, projected
+# to 128 dimensions by a fixed random matrix. The scale puts unrelated images
+# about 0.9 apart and rescaled or recompressed copies of the same image within
+# about 0.3, on either side of the default 0.6 tolerance like dlib's encodings.
+SYNTHETIC_THUMBNAIL_SIDE = 16
+SYNTHETIC_ENCODING_DIM = 128
+SYNTHETIC_SCALE = 0.65
+SYNTHETIC_SEED = 20240
+# Share of the shorter image side covered by the synthetic face box
+SYNTHETIC_FACE_FRACTION = 0.6
+
+
+class FaceEngine:
+    """
+    Detector plus encoder used by face_pipeline.extract_face
+
+    Locations are (top, right, bottom, left) in the pixels of the image
+    passed in, as face_recognition returns them. uses_cascade tells the
+    pipeline whether to spend time on the Haar pre-detector for this engine.
+    """
+    name = "base"
+    uses_cascade = False
+
+    def face_locations(self, image: np.ndarray, roi=None) -> list:
+        raise NotImplementedError
+
+    def face_encoding(self, image: np.ndarray, location) -> Optional[np.ndarray]:
+        raise NotImplementedError
+
+
+class DlibEngine(FaceEngine):
+    """face_recognition's HOG detector and dlib ResNet encoder"""
+    name = "dlib"
+    uses_cascade = True
+
+    def face_locations(self, image: np.ndarray, roi=None) -> list:
+        """HOG detection inside roi (falling back to the full frame on a miss), in image coordinates"""
+        if roi is not None:
+            top, right, bottom, left = roi
+            locations = face_recognition.face_locations(image[top:bottom, left:right], model="hog")
+            if locations:
+                return [(t + top, r + left, b + top, l + left) for t, r, b, l in locations]
+        return face_recognition.face_locations(image, model="hog")
+
+    def face_encoding(self, image: np.ndarray, location) -> Optional[np.ndarray]:
+        encodings = face_recognition.face_encodings(image, [location])
+        return encodings[0] if encodings else None
+
+
+class OpenCVEngine(FaceEngine):
+    """
+    OpenCV DNN YuNet detector and SFace recognizer (no dlib, no compiler)
+
+    Both ONNX models are loaded once per process from model_dir. YuNet's
+    five landmarks from the detection frame are not reused: like dlib's
+    shape predictor, face_encoding re-locates them inside the box on the
+    sharper encoding frame before SFace's aligned 112x112 crop.
+    """
+    name = "opencv"
+
+    def __init__(self, model_dir: Path = MODEL_DIR):
+        model_dir = Path(model_dir)
+        missing = [name for name in (YUNET_MODEL_FILE, SFACE_MODEL_FILE) if not (model_dir / name).exists()]
+        if missing:
+            raise RuntimeError(f"Face engine 'opencv' needs {', '.join(missing)} in {model_dir}")
+        self._detector = cv2.FaceDetectorYN.create(
+            str(model_dir / YUNET_MODEL_FILE), "", (320, 320), YUNET_SCORE_THRESHOLD, YUNET_NMS_THRESHOLD
+        )
+        self._recognizer = cv2.FaceRecognizerSF.create(str(model_dir / SFACE_MODEL_FILE), "")
+
+    def _detect(self, image: np.ndarray) -> np.ndarray:
+        """YuNet rows (x, y, w, h, 5 landmark pairs, score) for an RGB image"""
+        height, width = image.shape[:2]
+        self._detector.setInputSize((width, height))
+        _, faces = self._detector.detect(cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
+        return faces if faces is not None else np.empty((0, 15), np.float32)
+
+    def face_locations(self, image: np.ndarray, roi=None) -> list:
+        height, width = image.shape[:2]
+        return [
+            (max(0, int(y)), min(width, int(round(x + w))), min(height, int(round(y + h))), max(0, int(x)))
+            for x, y, w, h in self._detect(image)[:, :4]
+        ]
+
+    def face_encoding(self, image: np.ndarray, location) -> Optional[np.ndarray]:
+        top, right, bottom, left = location
+        height, width = image.shape[:2]
+        margin = int(max(bottom - top, right - left) * YUNET_CROP_MARGIN)
+        top, left = max(0, top - margin), max(0, left - margin)
+        crop = image[top:min(height, bottom + margin), left:min(width, right + margin)]
+        if crop.size == 0:
+            return None
+
+        faces = self._detect(crop)
+        if len(faces) == 0:
+            return None
+        face = faces[np.argmax(faces[:, -1])]
+        aligned = self._recognizer.alignCrop(cv2.cvtColor(crop, cv2.COLOR_RGB2BGR), face)
+        feature = self._recognizer.feature(aligned).ravel().astype(np.float64)
+        norm = np.linalg.norm(feature)
+        return feature / norm * SFACE_SCALE if norm else None
+
+
+def opencv_models_present(model_dir: Path = MODEL_DIR) -> bool:
+    return all((Path(model_dir) / name).exists() for name in (YUNET_MODEL_FILE, SFACE_MODEL_FILE))
+
+
+def busy_wait(milliseconds: float):
+    """Hold the CPU for a while, like a real detector would, instead of sleeping"""
+    if milliseconds <= 0:
+        return
+    deadline = time.perf_counter() + milliseconds / 1000
+    while time.perf_counter() < deadline:
+        pass
+
+
+class SyntheticEngine(FaceEngine):
+    """
+    Deterministic stand-in for dlib in tests, CI and load runs
+
+    Every frame has exactly one face, a centred box. Its encoding is a
+    function of the box's pixels only, so the same photo always lands on the
+    same point, re-encoded or rescaled copies land close by, and different
+    photos land far apart: enroll-then-verify and 1:N search behave like the
+    real engine at any gallery size. detect_ms and encode_ms add CPU-bound
+    latency so throughput tests see realistic worker occupancy.
+    """
+    name = "synthetic"
+
+    def __init__(self, detect_ms: float = 0.0, encode_ms: float = 0.0):
+        self.detect_ms = detect_ms
+        self.encode_ms = encode_ms
+        rng = np.random.default_rng(SYNTHETIC_SEED)
+        self._projection = rng.normal(
+            scale=SYNTHETIC_SCALE / np.sqrt(SYNTHETIC_ENCODING_DIM),
+            size=(SYNTHETIC_ENCODING_DIM, SYNTHETIC_THUMBNAIL_SIDE ** 2)
+        )
+
+    def face_locations(self, image: np.ndarray, roi=None) -> list:
+        busy_wait(self.detect_ms)
+        height, width = image.shape[:2]
+        side = int(min(height, width) * SYNTHETIC_FACE_FRACTION)
+        top = (height - side) // 2
+        left = (width - side) // 2
+        return [(top, left + side, top + side, left)]
+
+    def face_encoding(self, image: np.ndarray, location) -> Optional[np.ndarray]:
+        busy_wait(self.encode_ms)
+        top, right, bottom, left = location
+        face = image[top:bottom, left:right]
+        if face.size == 0:
+            return None
+        gray = cv2.cvtColor(face, cv2.COLOR_RGB2GRAY) if face.ndim == 3 else face
+        side = SYNTHETIC_THUMBNAIL_SIDE
+        thumbnail = cv2.resize(gray, (side, side), interpolation=cv2.INTER_AREA).astype(np.float64).ravel()
+        thumbnail -= thumbnail.mean()
+        norm = np.linalg.norm(thumbnail)
+        if norm == 0:
+            return None
+        return self._projection @ (thumbnail / norm)
+
+
+def resolve_engine_name(name: str, model_dir: str = '') -> str:
+    """
+    'auto' picks dlib when face_recognition is installed, then opencv when its
+    models are in model_dir, then the synthetic engine
+    """
+    model_dir = model_dir or MODEL_DIR
+    if name not in ENGINE_NAMES:
+        raise ValueError(f"Unknown face engine {name!r}, expected one of {', '.join(ENGINE_NAMES)}")
+    if name == 'auto':
+        if FACE_RECOGNITION_AVAILABLE:
+            return 'dlib'
+        return 'opencv' if opencv_models_present(model_dir) else 'synthetic'
+    if name == 'dlib' and not FACE_RECOGNITION_AVAILABLE:
+        raise RuntimeError("Face engine 'dlib' needs the face_recognition package")
+    if name == 'opencv' and not opencv_models_present(model_dir):
+        raise RuntimeError(f"Face engine 'opencv' needs {YUNET_MODEL_FILE} and {SFACE_MODEL_FILE} in {model_dir}")
+    return name
+
+
+_engines = {}
+
+
+def get_engine(name: str = 'auto', synthetic_latency_ms: tuple = (0.0, 0.0), model_dir: str = '') -> FaceEngine:
+    """Build an engine once per process and configuration"""
+    key = (resolve_engine_name(name, model_dir), tuple(synthetic_latency_ms), model_dir)
+    engine = _engines.get(key)
+    if engine is None:
+        if key[0] == 'dlib':
+            engine = DlibEngine()
+        elif key[0] == 'opencv':
+            engine = OpenCVEngine(model_dir or MODEL_DIR)
+        else:
+            engine = SyntheticEngine(*key[1])
+        _engines[key] = engine
+    return engine
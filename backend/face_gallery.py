@@ -0,0 +1,458 @@
+"""
+Face Gallery
+Resident matcher holding every enrolled face template in one float32 matrix
+"""
+
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ann_index import GalleryIndex
+
+ENCODING_DIM = 128
+INITIAL_CAPACITY = 1024
+
+# How a probe is compared with a student holding several templates
+MATCH_MIN = 'min'            # distance to the closest template
+MATCH_CENTROID = 'centroid'  # distance to the mean of the templates
+MATCH_MODES = (MATCH_MIN, MATCH_CENTROID)
+
+SNAPSHOT_MAGIC = b'FGALF32\x02'
+SNAPSHOT_HEADER = np.dtype([
+    ('magic', 'S8'),
+    ('dim', '<u4'),
+    ('rows', '<u4'),
+    ('store_count', '<i8'),
+    ('store_max_id', '<i8'),
+])
+SNAPSHOT_HEADER_BYTES = 64
+
+
+class _RowStore:
+    """
+    Growable float32 row matrix with cached squared norms and a parallel key array.
+
+    Released rows are zeroed, given an infinite norm so every distance to them
+    is infinite, and reused by the next allocation.
+    """
+
+    def __init__(self, dim: int, capacity: int):
+        self.dim = dim
+        self.matrix = np.zeros((capacity, dim), dtype=np.float32)
+        self.sq_norms = np.full(capacity, np.inf, dtype=np.float32)
+        self.keys = np.empty(capacity, dtype=object)
+        self.size = 0
+        self.free = []
+
+    @classmethod
+    def adopt(cls, matrix: np.ndarray, keys: Sequence[Optional[str]]) -> '_RowStore':
+        """Wrap an existing matrix, e.g. a memory map, without copying it"""
+        store = cls(matrix.shape[1], 0)
+        store.matrix = matrix
+        store.sq_norms = np.einsum('ij,ij->i', matrix, matrix).astype(np.float32)
+        store.keys = np.empty(len(keys), dtype=object)
+        store.keys[:] = keys
+        store.free = [row for row, key in enumerate(keys) if key is None]
+        store.sq_norms[store.free] = np.inf
+        store.size = len(keys)
+        return store
+
+    def _grow(self, capacity: int):
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        sq_norms = np.full(capacity, np.inf, dtype=np.float32)
+        keys = np.empty(capacity, dtype=object)
+        matrix[:self.size] = self.matrix[:self.size]
+        sq_norms[:self.size] = self.sq_norms[:self.size]
+        keys[:self.size] = self.keys[:self.size]
+        self.matrix, self.sq_norms, self.keys = matrix, sq_norms, keys
+
+    def allocate(self) -> int:
+        if self.free:
+            return self.free.pop()
+        if self.size == len(self.matrix):
+            self._grow(max(INITIAL_CAPACITY, 2 * len(self.matrix)))
+        self.size += 1
+        return self.size - 1
+
+    def set(self, row: int, key: str, vector: np.ndarray):
+        self.matrix[row] = vector
+        self.sq_norms[row] = float(vector @ vector)
+        self.keys[row] = key
+
+    def release(self, row: int):
+        self.matrix[row] = 0.0
+        self.sq_norms[row] = np.inf
+        self.keys[row] = None
+        self.free.append(row)
+
+    def view(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        n = self.size
+        return self.matrix[:n], self.sq_norms[:n], self.keys[:n]
+
+
+class FaceGallery:
+    """
+    Contiguous (N x 128) float32 template matrix with a parallel student_id array.
+
+    Each student owns one or more template rows. In 'min' mode a probe is
+    scored against every template and a student's distance is the smallest
+    of theirs; in 'centroid' mode a second matrix holds one mean template per
+    student and only that is scored. Either way all distances come from a
+    single matrix-vector product using ||a - b||^2 = ||a||^2 - 2 a.b + ||b||^2
+    and cached row norms. An optional GalleryIndex over the searched matrix
+    narrows 1:N queries to candidate rows first.
+    """
+
+    def __init__(self, dim: int = ENCODING_DIM, capacity: int = INITIAL_CAPACITY,
+                 index: Optional[GalleryIndex] = None, match_mode: str = MATCH_MIN):
+        if match_mode not in MATCH_MODES:
+            raise ValueError(f"Unknown match mode: {match_mode}")
+        self.dim = dim
+        self.index = index
+        self.match_mode = match_mode
+        self._lock = threading.Lock()
+        self._templates = _RowStore(dim, capacity)
+        self._centroids = _RowStore(dim, capacity if match_mode == MATCH_CENTROID else 0)
+        self._names = {}
+        self._rows: Dict[str, List[int]] = {}
+        self._centroid_rows: Dict[str, int] = {}
+        # Upper bound on templates per student, so top_k knows how many rows to rank
+        self._max_templates = 1
+        # Store version these templates mirror, kept by the owner (see GallerySnapshot)
+        self.version = None
+
+    @classmethod
+    def from_arrays(cls, ids: List[Optional[str]], names: Dict[str, str], matrix: np.ndarray,
+                    index: Optional[GalleryIndex] = None, match_mode: str = MATCH_MIN) -> 'FaceGallery':
+        """Adopt an existing (N x dim) template matrix without copying it; None ids mark free rows"""
+        gallery = cls(dim=matrix.shape[1], capacity=0, index=index, match_mode=match_mode)
+        gallery._templates = _RowStore.adopt(matrix, ids)
+        gallery._names = dict(names)
+        for row, student_id in enumerate(ids):
+            if student_id is not None:
+                gallery._rows.setdefault(student_id, []).append(row)
+        gallery._max_templates = max((len(rows) for rows in gallery._rows.values()), default=1)
+        if match_mode == MATCH_CENTROID:
+            for student_id, rows in gallery._rows.items():
+                gallery._set_centroid(student_id, matrix[rows])
+        return gallery
+
+    def export(self) -> Tuple[List[Optional[str]], Dict[str, str], np.ndarray]:
+        """Return (ids, names, matrix) for every template row, with None for free rows"""
+        with self._lock:
+            matrix, _, ids = self._templates.view()
+            return list(ids), dict(self._names), matrix
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, student_id: str) -> bool:
+        return student_id in self._rows
+
+    @property
+    def template_count(self) -> int:
+        return self._templates.size - len(self._templates.free)
+
+    def name_of(self, student_id: str) -> Optional[str]:
+        return self._names.get(student_id)
+
+    def templates_of(self, student_id: str) -> np.ndarray:
+        rows = self._rows.get(student_id, [])
+        return self._templates.matrix[rows].copy()
+
+    def _searched(self) -> _RowStore:
+        return self._centroids if self.match_mode == MATCH_CENTROID else self._templates
+
+    def _set_centroid(self, student_id: str, vectors: np.ndarray) -> int:
+        row = self._centroid_rows.get(student_id)
+        if row is None:
+            row = self._centroids.allocate()
+            self._centroid_rows[student_id] = row
+        self._centroids.set(row, student_id, vectors.mean(axis=0))
+        return row
+
+    def _index_rows(self, rows: List[int]):
+        if self.index is None:
+            return
+        store = self._searched()
+        if self.index.needs_training(store.size):
+            self.index.train(store.matrix[:store.size])
+        else:
+            for row in rows:
+                self.index.add(row, store.matrix[row])
+
+    def set_templates(self, student_id: str, name: str, encodings) -> Tuple[List[int], List[int]]:
+        """
+        Replace every template of a student, reusing their existing rows
+
+        Returns:
+            tuple: (rows now holding the templates in order, rows released)
+        """
+        vectors = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            rows = self._rows.get(student_id, [])
+            released = rows[len(vectors):]
+            rows = rows[:len(vectors)]
+            while len(rows) < len(vectors):
+                rows.append(self._templates.allocate())
+            for row, vector in zip(rows, vectors):
+                self._templates.set(row, student_id, vector)
+            for row in released:
+                self._templates.release(row)
+
+            if not rows:
+                # No templates left: the student is no longer enrolled
+                self._rows.pop(student_id, None)
+                self._names.pop(student_id, None)
+                centroid_row = self._centroid_rows.pop(student_id, None)
+                if centroid_row is not None:
+                    self._centroids.release(centroid_row)
+                return rows, released
+
+            self._names[student_id] = name
+            self._rows[student_id] = rows
+            self._max_templates = max(self._max_templates, len(rows))
+
+            if self.match_mode == MATCH_CENTROID:
+                self._index_rows([self._set_centroid(student_id, vectors)])
+            else:
+                self._index_rows(rows)
+            return rows, released
+
+    def add(self, student_id: str, name: str, encoding) -> int:
+        """Insert or replace a student's single template, returning its row"""
+        rows, _ = self.set_templates(student_id, name, [encoding])
+        return rows[0]
+
+    def attach_index(self, index: Optional[GalleryIndex]):
+        """Attach a candidate index after bulk loading, restoring or training it once"""
+        with self._lock:
+            store = self._searched()
+            matrix = store.matrix[:store.size]
+            if index is not None:
+                index.load(matrix)
+                if index.needs_training(store.size):
+                    index.train(matrix)
+            self.index = index
+
+    def _snapshot(self):
+        with self._lock:
+            return self._searched().view()
+
+    @staticmethod
+    def _distances(matrix: np.ndarray, sq_norms: np.ndarray, probe: np.ndarray) -> np.ndarray:
+        sq = sq_norms - 2.0 * (matrix @ probe) + float(probe @ probe)
+        np.maximum(sq, 0.0, out=sq)
+        return np.sqrt(sq, out=sq)
+
+    def distances(self, encoding) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (student_ids, distances) for every searched row (templates or centroids)"""
+        probe = np.asarray(encoding, dtype=np.float32).reshape(self.dim)
+        matrix, sq_norms, ids = self._snapshot()
+        return ids, self._distances(matrix, sq_norms, probe)
+
+    def _search(self, encoding) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (student_ids, distances) for the index candidates, or every row"""
+        probe = np.asarray(encoding, dtype=np.float32).reshape(self.dim)
+        matrix, sq_norms, ids = self._snapshot()
+        rows = self.index.candidates(probe) if self.index is not None else None
+        if rows is None:
+            return ids, self._distances(matrix, sq_norms, probe)
+        rows = rows[rows < len(ids)]
+        return ids[rows], self._distances(matrix[rows], sq_norms[rows], probe)
+
+    def top_k(self, encoding, k: int = 5) -> List[Tuple[str, str, float]]:
+        """Return the k closest distinct (student_id, name, distance) tuples, nearest first"""
+        ids, dists = self._search(encoding)
+        # A student holds at most _max_templates rows, so the k nearest students
+        # are always among the k * _max_templates nearest rows
+        m = min(len(dists), k * self._max_templates)
+        if m == 0:
+            return []
+        nearest = np.argpartition(dists, m - 1)[:m]
+        nearest = nearest[np.argsort(dists[nearest])]
+
+        results, seen = [], set()
+        for i in nearest:
+            student_id = ids[i]
+            if student_id is None or student_id in seen or not np.isfinite(dists[i]):
+                continue
+            seen.add(student_id)
+            results.append((student_id, self._names[student_id], float(dists[i])))
+            if len(results) == k:
+                break
+        return results
+
+    def verify(self, student_id: str, encoding) -> Optional[float]:
+        """Return the distance between a probe and one student (1:1), or None if not enrolled"""
+        with self._lock:
+            if self.match_mode == MATCH_CENTROID:
+                row = self._centroid_rows.get(student_id)
+                vectors = None if row is None else self._centroids.matrix[row:row + 1]
+            else:
+                rows = self._rows.get(student_id)
+                vectors = None if not rows else self._templates.matrix[rows]
+        if vectors is None:
+            return None
+        probe = np.asarray(encoding, dtype=np.float32).reshape(self.dim)
+        diff = vectors - probe
+        return float(np.sqrt(np.einsum('ij,ij->i', diff, diff).min()))
+
+    def best_match(self, encoding) -> Optional[Tuple[str, str, float]]:
+        """Return the closest (student_id, name, distance) or None for an empty gallery"""
+        ids, dists = self._search(encoding)
+        if len(dists) == 0:
+            return None
+        i = int(np.argmin(dists))
+        if not np.isfinite(dists[i]):
+            return None
+        return ids[i], self._names[ids[i]], float(dists[i])
+
+
+class GallerySnapshot:
+    """
+    Fixed-layout float32 gallery file for near-instant cold starts.
+
+    The file holds a 64-byte header followed by rows of little-endian float32,
+    and a sidecar .ids log of "row<TAB>student_id<TAB>name" lines; replaying
+    the log in order gives each row's owner, and an empty student_id marks a
+    released row. It is
+    opened with a copy-on-write memory map, so every worker process shares the
+    same page-cache pages until it writes to a row. The header records the
+    version of the authoritative SQLite store it was built from; a mismatch
+    means the snapshot is stale and must be rebuilt.
+
+    Several server processes may share one snapshot. append() only extends
+    a snapshot whose header still shows base_version, the store version the
+    appending gallery mirrored before its change; since the store itself
+    serializes writers, at most one process can hold that version, and every
+    other writer must invalidate() instead. Appends never touch rows other
+    processes may have mapped, so snapshot rows need not match the row
+    numbers of any process's resident gallery.
+    """
+
+    def __init__(self, path: Path, dim: int = ENCODING_DIM):
+        self.path = Path(path)
+        self.ids_path = self.path.with_suffix('.ids')
+        self.dim = dim
+
+    def _read_header(self):
+        if not self.path.exists() or not self.ids_path.exists():
+            return None
+        header = np.fromfile(self.path, dtype=SNAPSHOT_HEADER, count=1)
+        if len(header) == 0 or header['magic'][0] != SNAPSHOT_MAGIC or header['dim'][0] != self.dim:
+            return None
+        return header
+
+    def _read_ids(self, rows: int) -> Tuple[List[Optional[str]], Dict[str, str]]:
+        ids, names = [None] * rows, {}
+        with open(self.ids_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                row, student_id, name = line.rstrip('\n').split('\t', 2)
+                row = int(row)
+                if row >= rows:
+                    continue
+                ids[row] = student_id or None
+                if student_id:
+                    names[student_id] = name
+        return ids, names
+
+    @staticmethod
+    def _id_line(row: int, student_id: Optional[str], name: str = '') -> str:
+        return f"{row}\t{student_id or ''}\t{' '.join(str(name).split())}\n"
+
+    def load(self, version: Tuple[int, int], index: Optional[GalleryIndex] = None,
+             match_mode: str = MATCH_MIN) -> Optional[FaceGallery]:
+        """Map the snapshot if it matches the store version, else return None"""
+        header = self._read_header()
+        if header is None:
+            return None
+        if (int(header['store_count'][0]), int(header['store_max_id'][0])) != tuple(version):
+            return None
+
+        rows = int(header['rows'][0])
+        if os.path.getsize(self.path) < SNAPSHOT_HEADER_BYTES + rows * self.dim * 4:
+            return None
+        ids, names = self._read_ids(rows)
+        if rows == 0:
+            return FaceGallery(dim=self.dim, index=index, match_mode=match_mode)
+
+        matrix = np.memmap(self.path, dtype='<f4', mode='c', offset=SNAPSHOT_HEADER_BYTES, shape=(rows, self.dim))
+        return FaceGallery.from_arrays(ids, names, matrix, index=index, match_mode=match_mode)
+
+    def _header_bytes(self, rows: int, version: Tuple[int, int]) -> bytes:
+        header = np.zeros(1, dtype=SNAPSHOT_HEADER)
+        header['magic'] = SNAPSHOT_MAGIC
+        header['dim'] = self.dim
+        header['rows'] = rows
+        header['store_count'], header['store_max_id'] = version
+        return header.tobytes().ljust(SNAPSHOT_HEADER_BYTES, b'\0')
+
+    def write(self, gallery: FaceGallery, version: Tuple[int, int]):
+        """Rewrite the whole snapshot atomically from a gallery"""
+        ids, names, matrix = gallery.export()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Per-process temporary names, in case two workers rebuild at once
+        tmp_path = self.path.with_suffix(f'.{os.getpid()}.tmp')
+        tmp_ids_path = self.ids_path.with_suffix(f'.ids.{os.getpid()}.tmp')
+
+        with open(tmp_ids_path, 'w', encoding='utf-8') as f:
+            f.writelines(self._id_line(row, student_id, names[student_id])
+                         for row, student_id in enumerate(ids) if student_id is not None)
+        with open(tmp_path, 'wb') as f:
+            f.write(self._header_bytes(len(ids), version))
+            f.write(np.ascontiguousarray(matrix, dtype='<f4').tobytes())
+
+        os.replace(tmp_ids_path, self.ids_path)
+        os.replace(tmp_path, self.path)
+
+    def invalidate(self):
+        """Drop the snapshot so appends stop and the next load rebuilds from the store"""
+        for path in (self.path, self.ids_path):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def append(self, student_id: str, name: str, encodings,
+               version: Tuple[int, int], base_version: Tuple[int, int]) -> bool:
+        """
+        Replace one student's templates by writing new rows past the end
+
+        Rows that existed when the header was written are never modified:
+        other processes map them copy-on-write, and on Linux a private mapping
+        still sees writes to the file for pages it has not copied, under norms
+        it cached at load. The student's old rows are released in the .ids log
+        only, and the header is updated last as the commit point.
+
+        Returns False without writing when the snapshot is missing, was not
+        stamped with base_version, or is mostly released rows; the caller
+        should invalidate() it then so the next load rebuilds it compactly.
+        """
+        header = self._read_header()
+        if header is None:
+            return False
+        if (int(header['store_count'][0]), int(header['store_max_id'][0])) != tuple(base_version):
+            return False
+        vectors = np.asarray(encodings, dtype='<f4').reshape(-1, self.dim)
+        size = int(header['rows'][0])
+        ids, _ = self._read_ids(size)
+        released = [row for row, owner in enumerate(ids) if owner == student_id]
+        live = sum(1 for owner in ids if owner is not None) - len(released) + len(vectors)
+        if size + len(vectors) > 2 * max(live, INITIAL_CAPACITY):
+            return False
+        rows = range(size, size + len(vectors))
+
+        with open(self.ids_path, 'a', encoding='utf-8') as f:
+            f.writelines(self._id_line(row, student_id, name) for row in rows)
+            f.writelines(self._id_line(row, None) for row in released)
+        with open(self.path, 'r+b') as f:
+            f.seek(SNAPSHOT_HEADER_BYTES + size * self.dim * 4)
+            f.write(vectors.tobytes())
+            f.truncate()
+            f.seek(0)
+            f.write(self._header_bytes(size + len(vectors), version))
+        return True
@@ -0,0 +1,251 @@
+"""
+Face Pipeline
+CPU-bound image decoding, face detection and encoding
+
+Everything here is a plain top-level function with picklable inputs and
+outputs so it can run inside a ProcessPoolExecutor worker. This module must
+not import app.py, which initializes the database on import.
+"""
+
+import hashlib
+import io
+import time
+from typing import NamedTuple, Optional
+
+import numpy as np
+import cv2
+from PIL import Image
+
+from face_engines import get_engine
+
+# Longest image side used for detection / encoding; 0 keeps the full resolution
+DETECT_MAX_SIDE = 640
+ENCODE_MAX_SIDE = 1024
+
+# Quality gate, measured on the grayscale detection frame; 0 disables a check
+MIN_BRIGHTNESS = 35.0
+MIN_SHARPNESS = 15.0
+
+HAAR_CASCADE_FILE = 'haarcascade_frontalface_default.xml'
+# Haar boxes are tight around the eyes and mouth; HOG wants the whole head
+CASCADE_ROI_MARGIN = 0.35
+
+
+class PipelineSettings(NamedTuple):
+    """Tunables passed to extract_face (a NamedTuple so it pickles to worker processes)"""
+    detect_max_side: int = DETECT_MAX_SIDE
+    encode_max_side: int = ENCODE_MAX_SIDE
+    min_brightness: float = MIN_BRIGHTNESS
+    min_sharpness: float = MIN_SHARPNESS
+    use_cascade: bool = True
+    # face_engines name (auto, dlib, opencv or synthetic) and the synthetic engine's (detect, encode) delay
+    engine: str = 'auto'
+    synthetic_latency_ms: tuple = (0.0, 0.0)
+    # Directory of the opencv engine's ONNX models; empty for face_engines.MODEL_DIR
+    model_dir: str = ''
+
+# JPEG decoders can scale by 1/2, 1/4 or 1/8 during the IDCT, far cheaper than a full decode
+REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+# A reduced decode may undershoot the requested side by this much; resampling a
+# full decode down to an odd size costs more than the extra detail is worth
+REDUCED_DECODE_SLACK = 0.75
+
+
+def decode_image_bytes(image_bytes: bytes) -> np.ndarray:
+    """Decode JPEG/PNG bytes into an RGB array"""
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Failed to decode image")
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def photo_hash(image_bytes: bytes) -> str:
+    """Content fingerprint of an image file"""
+    return hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+
+
+def image_size(image_bytes: bytes):
+    """(width, height) from the image header without decoding pixels, or None"""
+    try:
+        return Image.open(io.BytesIO(image_bytes)).size
+    except Exception:
+        return None
+
+
+def decode_image_reduced(image_bytes: bytes, max_side: int) -> tuple:
+    """
+    Decode an image at the smallest JPEG scale that keeps roughly max_side pixels
+
+    Returns:
+        tuple: (RGB array, (width, height) of the original image)
+    """
+    size = image_size(image_bytes)
+    flag = cv2.IMREAD_COLOR
+    if size and max_side:
+        for factor, reduced_flag in REDUCED_DECODE_FLAGS:
+            if max(size) / factor >= max_side * REDUCED_DECODE_SLACK:
+                flag = reduced_flag
+                break
+
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), flag)
+    if image is None:
+        raise ValueError("Failed to decode image")
+    if size is None:
+        size = (image.shape[1], image.shape[0])
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB), size
+
+
+def fit_within(image: np.ndarray, max_side: int) -> np.ndarray:
+    """Downscale so the longest side is at most max_side"""
+    height, width = image.shape[:2]
+    if not max_side or max(height, width) <= max_side:
+        return image
+    scale = max_side / max(height, width)
+    return cv2.resize(image, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+
+
+def scale_location(location, from_shape, to_shape):
+    """Map a (top, right, bottom, left) box between two resolutions of the same frame"""
+    sy = to_shape[0] / from_shape[0]
+    sx = to_shape[1] / from_shape[1]
+    top, right, bottom, left = location
+    return (
+        max(0, int(top * sy)),
+        min(to_shape[1], int(round(right * sx))),
+        min(to_shape[0], int(round(bottom * sy))),
+        max(0, int(left * sx))
+    )
+
+
+def check_quality(gray: np.ndarray, settings: PipelineSettings) -> Optional[dict]:
+    """Reject frames too dark or too blurry for any detector; None when usable"""
+    brightness = float(gray.mean())
+    if settings.min_brightness and brightness < settings.min_brightness:
+        return {"ok": False, "reason": "image_too_dark",
+                "message": "Image is too dark, please move to a brighter spot"}
+
+    # Variance of the Laplacian: low when there are no sharp edges
+    sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+    if settings.min_sharpness and sharpness < settings.min_sharpness:
+        return {"ok": False, "reason": "image_too_blurry",
+                "message": "Image is too blurry, please hold the camera still"}
+
+    return None
+
+
+_cascade = None
+
+
+def get_cascade():
+    """Load the Haar face cascade once per process; None if OpenCV ships without it"""
+    global _cascade
+    if _cascade is None:
+        data_dir = getattr(getattr(cv2, 'data', None), 'haarcascades', '')
+        cascade = cv2.CascadeClassifier(data_dir + HAAR_CASCADE_FILE)
+        _cascade = False if cascade.empty() else cascade
+    return _cascade or None
+
+
+def cascade_roi(gray: np.ndarray):
+    """
+    Region of interest around every Haar face hit, as (top, right, bottom, left)
+
+    Returns None when there is no cascade or it finds nothing.
+    """
+    cascade = get_cascade()
+    if cascade is None:
+        return None
+
+    height, width = gray.shape[:2]
+    min_side = max(24, min(height, width) // 10)
+    boxes = cascade.detectMultiScale(gray, scaleFactor=1.15, minNeighbors=4, minSize=(min_side, min_side))
+    if len(boxes) == 0:
+        return None
+
+    x0 = min(x for x, y, w, h in boxes)
+    y0 = min(y for x, y, w, h in boxes)
+    x1 = max(x + w for x, y, w, h in boxes)
+    y1 = max(y + h for x, y, w, h in boxes)
+    margin = int(max(x1 - x0, y1 - y0) * CASCADE_ROI_MARGIN)
+    return (max(0, y0 - margin), min(width, x1 + margin), min(height, y1 + margin), max(0, x0 - margin))
+
+
+def elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 2)
+
+
+def _detect_and_encode(image_bytes: bytes, settings: PipelineSettings, timings: dict) -> dict:
+    start = time.perf_counter()
+    try:
+        image, original_size = decode_image_reduced(image_bytes, settings.encode_max_side)
+        image = fit_within(image, settings.encode_max_side)
+    except ValueError as e:
+        return {"ok": False, "reason": "invalid_image", "message": f"Invalid image: {str(e)}"}
+    timings["decode"] = elapsed_ms(start)
+
+    start = time.perf_counter()
+    detect_image = fit_within(image, settings.detect_max_side)
+    gray = cv2.cvtColor(detect_image, cv2.COLOR_RGB2GRAY)
+    rejection = check_quality(gray, settings)
+    timings["quality"] = elapsed_ms(start)
+    if rejection:
+        return rejection
+
+    engine = get_engine(settings.engine, settings.synthetic_latency_ms, settings.model_dir)
+    roi = None
+    if settings.use_cascade and engine.uses_cascade:
+        start = time.perf_counter()
+        roi = cascade_roi(gray)
+        timings["cascade"] = elapsed_ms(start)
+
+    start = time.perf_counter()
+    face_locations = engine.face_locations(detect_image, roi)
+    timings["detect"] = elapsed_ms(start)
+
+    if len(face_locations) == 0:
+        return {"ok": False, "reason": "no_face", "message": "No face detected in image"}
+
+    if len(face_locations) > 1:
+        return {"ok": False, "reason": "multiple_faces", "message": "Multiple faces detected"}
+
+    start = time.perf_counter()
+    location = scale_location(face_locations[0], detect_image.shape, image.shape)
+    encoding = engine.face_encoding(image, location)
+    timings["encode"] = elapsed_ms(start)
+
+    if encoding is None:
+        return {"ok": False, "reason": "no_encoding", "message": "Could not generate face encoding"}
+
+    return {
+        "ok": True,
+        "encoding": encoding,
+        "location": scale_location(location, image.shape, (original_size[1], original_size[0]))
+    }
+
+
+def extract_face(image_bytes: bytes, settings: PipelineSettings = PipelineSettings()) -> dict:
+    """
+    Decode an image and compute the encoding of its single face
+
+    The frame is decoded once at moderate resolution (encode_max_side) and
+    downscaled to detect_max_side. A brightness/blur gate rejects hopeless
+    frames in a few milliseconds, then the face engine (face_engines.py) detects
+    faces; for dlib a Haar cascade first narrows the region HOG searches (HOG
+    still scans the full frame when the cascade misses). The detected box is
+    mapped back to the moderate frame for landmarks and encoding.
+
+    Returns:
+        dict: {"ok": True, "encoding", "location"} or {"ok": False, "reason", "message"},
+        both with per-stage "timings" in milliseconds; location is in original image pixels
+    """
+    timings = {}
+    start = time.perf_counter()
+    result = _detect_and_encode(image_bytes, settings, timings)
+    timings["total"] = elapsed_ms(start)
+    result["timings"] = timings
+    return result
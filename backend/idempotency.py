@@ -0,0 +1,107 @@
+"""
+Idempotency Store
+Stored responses of completed writes, keyed by the client's operation ID
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from db_pool import SQLitePool
+
+
+def scoped_key(scope: str, operation_id: str) -> str:
+    """
+    sync_operations key of one client operation on one endpoint
+
+    Endpoints store differently shaped responses, so an ID reused across
+    them must not replay one endpoint's answer on the other. Scopes contain
+    no ':', which keeps 'a:' + id from ever colliding with 'b:' + id.
+    """
+    return f"{scope}:{operation_id}"
+
+
+class IdempotencyStore:
+    """
+    An LRU of recent responses in front of the sync_operations table.
+
+    The offline client retries a write with the same X-Operation-Id until it
+    sees a response, so most replays arrive within seconds of the original
+    and are answered from memory; older ones fall back to one primary-key
+    lookup. Responses are returned as stored, so callers must only record
+    outcomes that a retry should see again (not 5xx or admission rejects).
+    Keys are scoped_key() values, never bare client IDs.
+    """
+
+    def __init__(self, pool: SQLitePool, max_entries: int):
+        self._pool = pool
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._db_hits = 0
+        self._misses = 0
+
+    def _remember(self, key: str, response: dict):
+        with self._lock:
+            self._entries[key] = response
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def peek(self, key: str) -> Optional[dict]:
+        """Memory-only lookup, cheap enough to run on the event loop"""
+        with self._lock:
+            response = self._entries.get(key)
+            if response is None:
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return dict(response)
+
+    def get(self, key: str) -> Optional[dict]:
+        """Return a copy of the stored response, or None if the operation has not completed"""
+        response = self.peek(key)
+        if response is not None:
+            return response
+
+        with self._pool.connection() as conn:
+            row = conn.execute(
+                'SELECT response FROM sync_operations WHERE operation_id = ?', (key,)
+            ).fetchone()
+
+        with self._lock:
+            if row is None:
+                self._misses += 1
+                return None
+            self._db_hits += 1
+        response = json.loads(row['response'])
+        self._remember(key, response)
+        return dict(response)
+
+    def put(self, key: str, status: int, response: dict):
+        """Store a completed operation; the first response recorded for a key wins"""
+        with self._pool.connection() as conn:
+            inserted = conn.execute(
+                'INSERT OR IGNORE INTO sync_operations (operation_id, status, response) VALUES (?, ?, ?)',
+                (key, status, json.dumps(response))
+            ).rowcount
+            conn.commit()
+        if inserted:
+            self._remember(key, response)
+
+    def remember(self, results: dict):
+        """Cache responses that the caller already committed to sync_operations itself"""
+        for key, response in results.items():
+            self._remember(key, response)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "db_hits": self._db_hits,
+                "misses": self._misses
+            }
@@ -0,0 +1,128 @@
+"""
+QR Attendance Tokens
+Stateless HMAC-signed tokens with an expiry, plus a TTL set for single use
+"""
+
+import base64
+import binascii
+import hashlib
+import heapq
+import hmac
+import json
+import secrets
+import threading
+import time
+from typing import Optional
+
+# Truncated HMAC-SHA256; 128 bits is plenty for a token that lives a minute
+SIGNATURE_BYTES = 16
+NONCE_BYTES = 8
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class UsedTokenSet:
+    """
+    Nonces of redeemed tokens, kept only until the token would have expired anyway.
+
+    An expired token is rejected by its signature check alone, so entries can
+    be dropped at expiry and the set never holds more than one QR validity
+    window of redemptions.
+    """
+
+    def __init__(self):
+        self._expiry = {}
+        self._heap = []
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float):
+        while self._heap and self._heap[0][0] <= now:
+            _, nonce = heapq.heappop(self._heap)
+            self._expiry.pop(nonce, None)
+
+    def add(self, nonce: str, expires_at: float, now: float) -> bool:
+        """Record a redemption; False if the nonce was already redeemed"""
+        with self._lock:
+            self._evict(now)
+            if nonce in self._expiry:
+                return False
+            self._expiry[nonce] = expires_at
+            heapq.heappush(self._heap, (expires_at, nonce))
+            return True
+
+    def __contains__(self, nonce: str) -> bool:
+        with self._lock:
+            return nonce in self._expiry
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._evict(time.time())
+            return len(self._expiry)
+
+
+class QRTokenService:
+    """
+    Issues and checks attendance tokens of the form <payload>.<signature>.
+
+    The payload carries the student ID, name, expiry and a random nonce, so
+    validation needs neither the database nor the teacher's browser.
+    """
+
+    def __init__(self, secret: bytes, validity_seconds: int):
+        self._secret = secret
+        self.validity_seconds = validity_seconds
+        self.used = UsedTokenSet()
+
+    def _sign(self, payload: bytes) -> bytes:
+        return hmac.new(self._secret, payload, hashlib.sha256).digest()[:SIGNATURE_BYTES]
+
+    def issue(self, student_id: str, student_name: str, now: Optional[float] = None) -> tuple:
+        """
+        Returns:
+            tuple: (token, expiry as a Unix timestamp)
+        """
+        now = time.time() if now is None else now
+        expires_at = int(now) + self.validity_seconds
+        claims = {"sid": student_id, "name": student_name, "exp": expires_at,
+                  "nonce": _b64encode(secrets.token_bytes(NONCE_BYTES))}
+        payload = json.dumps(claims, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        return f"{_b64encode(payload)}.{_b64encode(self._sign(payload))}", expires_at
+
+    def _check(self, token: str, now: float) -> dict:
+        try:
+            payload_text, signature_text = token.split(".")
+            payload = _b64decode(payload_text)
+            signature = _b64decode(signature_text)
+        except (ValueError, binascii.Error):
+            return {"ok": False, "reason": "invalid_token", "message": "Invalid attendance token"}
+
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            return {"ok": False, "reason": "invalid_token", "message": "Invalid attendance token"}
+
+        claims = json.loads(payload)
+        result = {"ok": True, "studentId": claims["sid"], "studentName": claims["name"],
+                  "expiresAt": claims["exp"], "nonce": claims["nonce"]}
+        if now >= claims["exp"]:
+            result.update(ok=False, reason="token_expired",
+                          message="This attendance link has expired. Please get a new QR code.")
+        elif claims["nonce"] in self.used:
+            result.update(ok=False, reason="token_used", message="This attendance link has already been used")
+        return result
+
+    def validate(self, token: str, now: Optional[float] = None) -> dict:
+        """Check the signature, expiry and single-use state without redeeming the token"""
+        return self._check(token, time.time() if now is None else now)
+
+    def redeem(self, token: str, now: Optional[float] = None) -> dict:
+        """Validate the token and mark it used; only the first redemption succeeds"""
+        now = time.time() if now is None else now
+        result = self._check(token, now)
+        if result["ok"] and not self.used.add(result["nonce"], result["expiresAt"], now):
+            result.update(ok=False, reason="token_used", message="This attendance link has already been used")
+        return result
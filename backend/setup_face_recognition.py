@@ -7,21 +7,116 @@ This script will:
 3. Test the complete face recognition pipeline
 """
 
+import argparse
 import os
-import sqlite3
-import face_recognition
+import time
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+from db_pool import SQLitePool
+from face_engines import resolve_engine_name
+from face_pipeline import PipelineSettings, extract_face, photo_hash
+
 # Configuration
 DB_FILE = Path(__file__).parent / 'data' / 'attendance.db'
 IMAGES_DIR = Path(__file__).parent / 'data' / 'student_images'
+db_pool = SQLitePool(DB_FILE, size=1)
+
+# Results written per transaction; a crash loses at most one chunk
+CHUNK_SIZE = 100
+DEFAULT_WORKERS = os.cpu_count() or 1
+# Same engine selection as app.py, whose gallery must be built by the engine it verifies with
+PIPELINE_SETTINGS = PipelineSettings(
+    engine=os.getenv('FACE_ENGINE', 'auto'),
+    model_dir=os.getenv('FACE_MODEL_DIR', str(Path(__file__).parent / 'models'))
+)
+
+def encode_photo(image_file: Path, known_hash: str = None) -> dict:
+    """
+    Encode one student photo (runs in a worker process)
+    
+    Skips the encoding when the file content still matches known_hash.
+    """
+    image_bytes = image_file.read_bytes()
+    content_hash = photo_hash(image_bytes)
+    result = {
+        "student_id": image_file.stem,
+        "path": str(image_file),
+        "mtime": image_file.stat().st_mtime,
+        "hash": content_hash
+    }
+    
+    if content_hash == known_hash:
+        result["status"] = "unchanged"
+        return result
+    
+    face = extract_face(image_bytes, PIPELINE_SETTINGS)
+    if face["ok"]:
+        result["status"] = "encoded"
+        result["encoding"] = np.asarray(face["encoding"], dtype=np.float64).tobytes()
+    else:
+        result["status"] = "failed"
+        result["message"] = face["message"]
+    return result
 
-def generate_face_encodings():
-    """Generate face encodings for all student photos"""
+def pending_photos(cursor, image_files: list, force: bool = False) -> list:
+    """(image_file, known_hash) for every photo whose stored encoding is not current"""
+    stored = {
+        row[0]: (row[1], row[2])
+        # Later rows win, so each student maps to their most recent photo-backed template
+        for row in cursor.execute('''
+            SELECT student_id, photo_mtime, photo_hash FROM face_encodings
+            WHERE photo_hash IS NOT NULL ORDER BY id
+        ''')
+    }
+    
+    pending = []
+    for image_file in image_files:
+        mtime, known_hash = stored.get(image_file.stem, (None, None))
+        if not force and mtime is not None and mtime == image_file.stat().st_mtime:
+            continue
+        pending.append((image_file, None if force else known_hash))
+    return pending
+
+def write_results(cursor, results: list):
+    """Apply one chunk of worker results"""
+    encoded = [r for r in results if r["status"] == "encoded"]
+    unchanged = [r for r in results if r["status"] == "unchanged"]
+    
+    cursor.executemany('''
+        UPDATE students
+        SET photo_path = ?, has_face_encoding = 1
+        WHERE student_id = ?
+    ''', [(r["path"], r["student_id"]) for r in encoded])
+    
+    # The photo folder is authoritative for enrolled templates; auto-added captures are kept
+    cursor.executemany('''
+        DELETE FROM face_encodings WHERE student_id = ? AND source = 'enrolled'
+    ''', [(r["student_id"],) for r in encoded])
+    
+    cursor.executemany('''
+        INSERT INTO face_encodings (student_id, encoding, photo_mtime, photo_hash, source)
+        VALUES (?, ?, ?, ?, 'enrolled')
+    ''', [(r["student_id"], r["encoding"], r["mtime"], r["hash"]) for r in encoded])
+    
+    # Touched but identical files: record the new mtime so the next run skips them without hashing
+    cursor.executemany('''
+        UPDATE face_encodings SET photo_mtime = ? WHERE student_id = ? AND photo_hash = ?
+    ''', [(r["mtime"], r["student_id"], r["hash"]) for r in unchanged])
+
+def generate_face_encodings(workers: int = DEFAULT_WORKERS, chunk_size: int = CHUNK_SIZE,
+                            force: bool = False):
+    """Generate face encodings for every student photo whose encoding is missing or stale"""
     print("🔍 GENERATING FACE ENCODINGS")
     print("=" * 50)
     
+    engine = resolve_engine_name(PIPELINE_SETTINGS.engine, PIPELINE_SETTINGS.model_dir)
+    if engine == 'synthetic':
+        print("❌ No real face engine (face_recognition or the OpenCV models); refusing to store synthetic encodings")
+        return False
+    print(f"🔧 Face engine: {engine}")
+    
     if not IMAGES_DIR.exists():
         print(f"❌ Images directory not found: {IMAGES_DIR}")
         return False
@@ -33,106 +128,83 @@ def generate_face_encodings():
         print("❌ No image files found in student_images directory")
         return False
     
-    print(f"📁 Found {len(image_files)} image files:")
-    for img_file in image_files:
-        print(f"   - {img_file.name}")
-    
     # Connect to database
-    conn = sqlite3.connect(DB_FILE)
+    conn = db_pool.acquire()
     cursor = conn.cursor()
     
-    successful_encodings = 0
-    failed_encodings = 0
-    
-    for image_file in image_files:
-        print(f"\n🔍 Processing: {image_file.name}")
+    try:
+        pending = pending_photos(cursor, image_files, force)
+        print(f"📁 Found {len(image_files)} image files, {len(image_files) - len(pending)} already current")
+        if not pending:
+            return True
         
-        try:
-            # Extract student ID from filename
-            student_id = image_file.stem
-            print(f"   Student ID: {student_id}")
-            
-            # Load image
-            image = face_recognition.load_image_file(str(image_file))
-            print(f"   ✅ Image loaded successfully")
-            
-            # Find face locations
-            face_locations = face_recognition.face_locations(image, model="hog")
-            print(f"   🔍 Found {len(face_locations)} face(s)")
-            
-            if len(face_locations) == 0:
-                print(f"   ⚠️ No face found in image")
-                failed_encodings += 1
-                continue
-            
-            if len(face_locations) > 1:
-                print(f"   ⚠️ Multiple faces found, using the first one")
-            
-            # Generate face encoding
-            face_encodings = face_recognition.face_encodings(image, face_locations)
-            
-            if len(face_encodings) == 0:
-                print(f"   ❌ Could not generate face encoding")
-                failed_encodings += 1
-                continue
-            
-            # Use the first face encoding
-            face_encoding = face_encodings[0]
-            print(f"   ✅ Face encoding generated successfully")
-            
-            # Convert encoding to bytes for storage
-            encoding_bytes = face_encoding.tobytes()
-            
-            # Update database
-            cursor.execute('''
-                UPDATE students 
-                SET photo_path = ?, has_face_encoding = 1
-                WHERE student_id = ?
-            ''', (str(image_file), student_id))
-            
-            # Store encoding in separate table
-            cursor.execute('''
-                INSERT OR REPLACE INTO face_encodings (student_id, encoding)
-                VALUES (?, ?)
-            ''', (student_id, encoding_bytes))
-            
-            print(f"   💾 Database updated for {student_id}")
-            successful_encodings += 1
-            
-        except Exception as e:
-            print(f"   ❌ Error processing {image_file.name}: {e}")
-            failed_encodings += 1
-            continue
-    
-    conn.commit()
-    conn.close()
+        print(f"⚙️  Encoding {len(pending)} photos with {workers} worker(s), {chunk_size} per transaction")
+        counts = {"encoded": 0, "unchanged": 0, "failed": 0}
+        chunk = []
+        start = time.perf_counter()
+        
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            paths = [image_file for image_file, _ in pending]
+            known_hashes = [known_hash for _, known_hash in pending]
+            for result in executor.map(encode_photo, paths, known_hashes, chunksize=4):
+                counts[result["status"]] += 1
+                if result["status"] == "failed":
+                    print(f"   ⚠️ {Path(result['path']).name}: {result['message']}")
+                
+                chunk.append(result)
+                if len(chunk) >= chunk_size:
+                    write_results(cursor, chunk)
+                    conn.commit()
+                    chunk = []
+                    done = sum(counts.values())
+                    print(f"   💾 {done}/{len(pending)} saved ({done / (time.perf_counter() - start):.1f} images/s)")
+        
+        if chunk:
+            write_results(cursor, chunk)
+            conn.commit()
+        elapsed = time.perf_counter() - start
+    finally:
+        db_pool.release(conn)
     
     print(f"\n📊 ENCODING SUMMARY:")
-    print(f"   ✅ Successful: {successful_encodings}")
-    print(f"   ❌ Failed: {failed_encodings}")
+    print(f"   ✅ Encoded: {counts['encoded']}")
+    print(f"   ⏭️  Unchanged: {counts['unchanged']}")
+    print(f"   ❌ Failed: {counts['failed']}")
+    print(f"   ⏱️  {len(pending)} images in {elapsed:.1f} s ({len(pending) / elapsed:.1f} images/s)")
     
-    return successful_encodings > 0
+    return counts["encoded"] + counts["unchanged"] > 0
 
 def create_face_encodings_table():
     """Create the face_encodings table if it doesn't exist"""
     print("\n🔧 CREATING FACE ENCODINGS TABLE")
     print("=" * 50)
     
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS face_encodings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            student_id TEXT UNIQUE NOT NULL,
-            encoding BLOB NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (student_id) REFERENCES students (student_id)
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS face_encodings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                student_id TEXT NOT NULL,
+                encoding BLOB NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                photo_mtime REAL,
+                photo_hash TEXT,
+                source TEXT NOT NULL DEFAULT 'enrolled',
+                FOREIGN KEY (student_id) REFERENCES students (student_id)
+            )
+        ''')
+        
+        # Columns added after the first release (app.py also drops the old UNIQUE on student_id)
+        columns = {row[1] for row in cursor.execute('PRAGMA table_info(face_encodings)')}
+        if 'photo_mtime' not in columns:
+            cursor.execute('ALTER TABLE face_encodings ADD COLUMN photo_mtime REAL')
+        if 'photo_hash' not in columns:
+            cursor.execute('ALTER TABLE face_encodings ADD COLUMN photo_hash TEXT')
+        if 'source' not in columns:
+            cursor.execute("ALTER TABLE face_encodings ADD COLUMN source TEXT NOT NULL DEFAULT 'enrolled'")
+        
+        conn.commit()
     print("✅ Face encodings table created/verified")
 
 def test_face_recognition():
@@ -186,6 +258,12 @@ def test_face_recognition():
         return False
 
 def main():
+    parser = argparse.ArgumentParser(description="Generate face encodings for student photos")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="encoder processes")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="results per transaction")
+    parser.add_argument('--force', action='store_true', help="re-encode photos that are already current")
+    args = parser.parse_args()
+    
     print("🚀 COMPLETE FACE RECOGNITION SETUP")
     print("=" * 60)
     
@@ -193,7 +271,7 @@ def main():
     create_face_encodings_table()
     
     # Step 2: Generate face encodings
-    if not generate_face_encodings():
+    if not generate_face_encodings(args.workers, args.chunk_size, args.force):
         print("❌ Face encoding generation failed")
         return False
     
@@ -9,9 +9,12 @@ Run with: python setup_students.py
 import sqlite3
 from pathlib import Path
 
+from db_pool import SQLitePool
+
 # Database configuration
 BASE_DIR = Path(__file__).parent
 DB_FILE = BASE_DIR / 'data' / 'attendance.db'
+db_pool = SQLitePool(DB_FILE, size=1)
 
 def setup_students():
     """Connect to SQLite database and insert the three real students"""
@@ -23,50 +26,49 @@ def setup_students():
     
     try:
         # Connect to database
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        # Create students table if not exists
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS students (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                student_id TEXT UNIQUE NOT NULL,
-                name TEXT NOT NULL,
-                grade TEXT,
-                photo_path TEXT,
-                has_face_encoding INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Real students to insert
-        students = [
-            ('20221CIT0043', 'Amrutha M', 'CIT 2022'),
-            ('20221CIT0049', 'CM Shalini', 'CIT 2022'),
-            ('20221CIT0151', 'Vismaya L', 'CIT 2022')
-        ]
-        
-        # Insert or replace students
-        for student_id, name, grade in students:
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Create students table if not exists
             cursor.execute('''
-                INSERT OR REPLACE INTO students (student_id, name, grade)
-                VALUES (?, ?, ?)
-            ''', (student_id, name, grade))
-            print(f"✅ Student {student_id} - {name} ({grade}) added/updated")
-        
-        # Commit changes
-        conn.commit()
-        
-        # Verify insertion
-        cursor.execute('SELECT student_id, name, grade FROM students ORDER BY student_id')
-        all_students = cursor.fetchall()
-        
-        print(f"\n📊 Total students in database: {len(all_students)}")
-        print("\n📋 Current Students:")
-        for student in all_students:
-            print(f"   {student[0]} - {student[1]} ({student[2]})")
+                CREATE TABLE IF NOT EXISTS students (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    student_id TEXT UNIQUE NOT NULL,
+                    name TEXT NOT NULL,
+                    grade TEXT,
+                    photo_path TEXT,
+                    has_face_encoding INTEGER DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Real students to insert
+            students = [
+                ('20221CIT0043', 'Amrutha M', 'CIT 2022'),
+                ('20221CIT0049', 'CM Shalini', 'CIT 2022'),
+                ('20221CIT0151', 'Vismaya L', 'CIT 2022')
+            ]
+            
+            # Insert or replace students
+            for student_id, name, grade in students:
+                cursor.execute('''
+                    INSERT OR REPLACE INTO students (student_id, name, grade)
+                    VALUES (?, ?, ?)
+                ''', (student_id, name, grade))
+                print(f"✅ Student {student_id} - {name} ({grade}) added/updated")
+            
+            # Commit changes
+            conn.commit()
+            
+            # Verify insertion
+            cursor.execute('SELECT student_id, name, grade FROM students ORDER BY student_id')
+            all_students = cursor.fetchall()
+            
+            print(f"\n📊 Total students in database: {len(all_students)}")
+            print("\n📋 Current Students:")
+            for student in all_students:
+                print(f"   {student[0]} - {student[1]} ({student[2]})")
         
-        conn.close()
         print(f"\n✅ Students setup completed successfully!")
         print(f"📁 Database location: {DB_FILE}")
         
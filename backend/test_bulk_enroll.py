@@ -0,0 +1,123 @@
+"""
+test_bulk_enroll.py - Bulk Enrollment Check
+
+Drives /api/admin/bulk-enroll through the TestClient with small zip and tar
+archives and the synthetic face engine. The TestClient runs the background
+job before returning, so every check sees the finished job.
+
+Run with: pytest test_bulk_enroll.py
+"""
+
+import io
+import tarfile
+import zipfile
+
+import cv2
+import numpy as np
+
+import app
+from fastapi.testclient import TestClient
+
+client = TestClient(app.app)
+
+
+def photo(seed: int, extension: str = '.jpg') -> bytes:
+    pixels = np.random.default_rng(seed).integers(0, 256, (240, 320, 3), dtype=np.uint8)
+    return cv2.imencode(extension, pixels)[1].tobytes()
+
+
+def zip_archive(members: dict) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def tar_archive(members: dict) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def roster(*student_ids: str) -> bytes:
+    return ("studentId,studentName,grade\n" + "".join(f"{sid},Student {sid},7\n" for sid in student_ids)).encode()
+
+
+def submit(archive: bytes, roster_csv: bytes, filename: str = 'photos.zip'):
+    return client.post('/api/admin/bulk-enroll', files={
+        "archive": (filename, archive, "application/octet-stream"),
+        "roster": ("roster.csv", roster_csv, "text/csv")
+    })
+
+
+def job(response) -> dict:
+    assert response.status_code == 202, response.text
+    return client.get(response.json()["statusUrl"]).json()
+
+
+def identify(image_bytes: bytes) -> dict:
+    return client.post('/api/verify-face', content=image_bytes, headers={"content-type": "image/jpeg"}).json()
+
+
+def test_zip_archive_enrolls_rostered_photos():
+    archive = zip_archive({
+        'class7/BULK-1.jpg': photo(1),
+        'class7/BULK-2.JPEG': photo(2),
+        'BULK-3.png': photo(3, '.png'),
+        'other/BULK-1.jpg': photo(4),
+        'BULK-9.jpg': photo(9),
+        '__MACOSX/class7/._BULK-1.jpg': b'resource fork',
+        'notes.txt': b'not a photo'
+    })
+    result = job(submit(archive, roster('BULK-1', 'BULK-2', 'BULK-3', 'BULK-4')))
+
+    assert result["status"] == "completed", result
+    counts = {key: result[key] for key in ("total", "processed", "enrolled", "failed", "skipped")}
+    assert counts == {"total": 4, "processed": 3, "enrolled": 3, "failed": 1, "skipped": 2}, counts
+    assert sorted((error["studentId"], error["errorCode"]) for error in result["errors"]) == [
+        ('BULK-1', 'DUPLICATE_PHOTO'), ('BULK-4', 'MISSING_PHOTO'), ('BULK-9', 'NOT_IN_ROSTER')
+    ], result["errors"]
+
+    # The rebuilt gallery is swapped in once the job finishes
+    assert identify(photo(2))["studentId"] == 'BULK-2'
+    assert identify(photo(3, '.png'))["studentId"] == 'BULK-3'
+
+
+def test_tar_archive():
+    result = job(submit(tar_archive({'photos/BULK-T.jpg': photo(11)}), roster('BULK-T'), 'photos.tar.gz'))
+    assert result["status"] == "completed" and result["enrolled"] == 1, result
+    assert identify(photo(11))["studentId"] == 'BULK-T'
+
+
+def test_invalid_roster_is_rejected():
+    archive = zip_archive({'BULK-R.jpg': photo(12)})
+    for bad_roster in (b"studentId,studentName\nBULK-R,\n", b"studentId,studentName\n", b"\xff\xfe\x00"):
+        response = submit(archive, bad_roster)
+        assert response.status_code == 400 and "Invalid roster" in response.json()["detail"], response.text
+    assert not any(j["status"] in ("queued", "running") for j in app.bulk_jobs.values()), app.bulk_jobs
+
+
+def test_second_job_is_refused_while_one_runs():
+    with app.bulk_jobs_lock:
+        app.bulk_jobs['running-job'] = {"jobId": 'running-job', "status": "running"}
+    try:
+        response = submit(zip_archive({'BULK-S.jpg': photo(13)}), roster('BULK-S'))
+        assert response.status_code == 409, response.text
+    finally:
+        with app.bulk_jobs_lock:
+            del app.bulk_jobs['running-job']
+
+
+def test_invalid_archive_frees_the_slot():
+    response = submit(b'not an archive', roster('BULK-F'))
+    assert response.status_code == 400, response.text
+    assert not any(j["status"] in ("queued", "running") for j in app.bulk_jobs.values()), app.bulk_jobs
+    assert not list(app.BULK_ENROLL_DIR.glob('*.archive'))
+
+    result = job(submit(zip_archive({'BULK-F.jpg': photo(14)}), roster('BULK-F')))
+    assert result["status"] == "completed" and result["enrolled"] == 1, result
@@ -0,0 +1,113 @@
+"""
+test_counters.py - Today-Stats Counter Check
+
+The today-stats endpoint reads trigger-maintained counters instead of
+counting rows. Checks that the triggers keep them exact through inserts,
+deletes, date updates and INSERT OR REPLACE on pooled connections, and that
+/api/admin/reconcile-counters repairs a count that drifted anyway.
+
+Run with: pytest test_counters.py
+"""
+
+import sqlite3
+
+import pytest
+
+import app
+from db_pool import SQLitePool
+from fastapi.testclient import TestClient
+
+DAY = '2026-03-02'
+NEXT_DAY = '2026-03-03'
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = SQLitePool(tmp_path / 'attendance.db', size=2)
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        app.create_tables(cursor)
+        app.migrate_schema(cursor)
+        app.reconcile_counters(cursor)
+        conn.commit()
+    yield pool
+    pool.close()
+
+
+def counters(conn, day: str) -> tuple:
+    """(total_students, present_count) as today-stats reads them"""
+    row = conn.execute(app.TODAY_STATS_QUERY, (day,)).fetchone()
+    return row['total_students'], row['present_count']
+
+
+def actual(conn, day: str) -> tuple:
+    students = conn.execute('SELECT COUNT(*) FROM students').fetchone()[0]
+    present = conn.execute('SELECT COUNT(DISTINCT student_id) FROM attendance WHERE date = ?', (day,)).fetchone()[0]
+    return students, present
+
+
+def mark(conn, student_id: str, day: str = DAY):
+    conn.execute('''
+        INSERT INTO attendance (student_id, student_name, date, check_in_time, method)
+        VALUES (?, ?, ?, '08:00:00', 'qr')
+    ''', (student_id, student_id, day))
+
+
+def test_attendance_insert_delete_and_date_update(pool):
+    with pool.connection() as conn:
+        conn.executemany('INSERT INTO students (student_id, name) VALUES (?, ?)',
+                         [(f'CNT-{i}', f'Student {i}') for i in range(3)])
+        for i in range(3):
+            mark(conn, f'CNT-{i}')
+        assert counters(conn, DAY) == actual(conn, DAY) == (3, 3)
+
+        conn.execute('DELETE FROM attendance WHERE student_id = ?', ('CNT-0',))
+        assert counters(conn, DAY) == actual(conn, DAY) == (3, 2)
+
+        conn.execute('UPDATE attendance SET date = ? WHERE student_id = ?', (NEXT_DAY, 'CNT-1'))
+        assert counters(conn, DAY) == actual(conn, DAY) == (3, 1)
+        assert counters(conn, NEXT_DAY) == actual(conn, NEXT_DAY) == (3, 1)
+
+        # Touching other columns must not move the count
+        conn.execute("UPDATE attendance SET check_in_time = '09:00:00' WHERE student_id = ?", ('CNT-2',))
+        assert counters(conn, DAY) == actual(conn, DAY) == (3, 1)
+
+        conn.execute('DELETE FROM students WHERE student_id = ?', ('CNT-2',))
+        assert counters(conn, DAY) == actual(conn, DAY) == (2, 1)
+        conn.commit()
+
+
+def test_student_replace_through_pool(pool):
+    with pool.connection() as conn:
+        conn.execute('INSERT INTO students (student_id, name) VALUES (?, ?)', ('CNT-R', 'Before'))
+        for name in ('After', 'Again'):
+            conn.execute('INSERT OR REPLACE INTO students (student_id, name) VALUES (?, ?)', ('CNT-R', name))
+        assert counters(conn, DAY) == actual(conn, DAY) == (1, 0)
+        conn.commit()
+
+
+def test_student_replace_without_recursive_triggers_drifts(pool):
+    # Documents why db_pool turns recursive_triggers on: the REPLACE delete fires no trigger without it
+    conn = sqlite3.connect(pool.db_file)
+    conn.row_factory = sqlite3.Row
+    conn.execute('INSERT INTO students (student_id, name) VALUES (?, ?)', ('CNT-D', 'Before'))
+    conn.execute('INSERT OR REPLACE INTO students (student_id, name) VALUES (?, ?)', ('CNT-D', 'After'))
+    assert counters(conn, DAY) == (2, 0) and actual(conn, DAY) == (1, 0)
+    conn.close()
+
+
+def test_reconcile_endpoint_repairs_drift():
+    client = TestClient(app.app)
+    with app.db_pool.connection() as conn:
+        conn.execute('INSERT OR IGNORE INTO students (student_id, name) VALUES (?, ?)', ('CNT-E', 'Endpoint'))
+        conn.execute("UPDATE stat_counters SET value = value + 5 WHERE name = 'students'")
+        conn.execute("UPDATE attendance_daily_stats SET present_count = present_count + 2")
+        conn.commit()
+        expected = actual(conn, app.date.today().isoformat())
+        assert counters(conn, app.date.today().isoformat()) != expected
+
+    response = client.post('/api/admin/reconcile-counters')
+    assert response.status_code == 200, response.text
+
+    stats = client.get('/api/attendance/today-stats').json()
+    assert (stats['totalStudents'], stats['presentCount']) == expected, (stats, expected)
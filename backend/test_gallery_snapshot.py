@@ -0,0 +1,81 @@
+"""
+test_gallery_snapshot.py - Shared Gallery Snapshot Check
+
+Starts app.py against a scratch data directory and plays two server
+processes that share one gallery snapshot by swapping app.face_gallery
+between two independently loaded galleries. Enrollments from both must
+survive a restart, and each process must pick up the other's enrollments.
+
+Run with: pytest test_gallery_snapshot.py
+"""
+
+
+import numpy as np
+
+import app
+from face_gallery import ENCODING_DIM
+
+
+def encoding(seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).normal(size=ENCODING_DIM) * 0.1
+
+
+def enroll(gallery, student_id: str, seed: int):
+    """Enroll as the worker whose resident gallery is gallery"""
+    app.face_gallery = gallery
+    student = app.StudentPhotoFields(studentId=student_id, studentName=student_id)
+    app.enroll_student(student, f"photo {student_id}".encode(), encoding(seed))
+    return app.face_gallery
+
+
+def test_interleaved_workers_survive_restart():
+    worker_a = app.load_encodings()
+    worker_b = app.load_encodings()
+    enroll(worker_a, 'SNAP-X', 1)
+    enroll(worker_b, 'SNAP-Y', 2)
+
+    restarted = app.load_encodings()
+    for student_id, seed in (('SNAP-X', 1), ('SNAP-Y', 2)):
+        distance = restarted.verify(student_id, encoding(seed))
+        assert distance is not None and distance < 1e-3, (student_id, distance)
+
+
+def test_refresh_picks_up_other_worker():
+    worker_a = app.load_encodings()
+    worker_b = app.load_encodings()
+    enroll(worker_a, 'SNAP-Z', 3)
+    assert worker_b.verify('SNAP-Z', encoding(3)) is None
+
+    app.face_gallery = worker_b
+    app.refresh_gallery()
+    assert app.face_gallery is not worker_b
+    assert app.face_gallery.verify('SNAP-Z', encoding(3)) is not None
+
+
+def test_append_requires_base_version():
+    gallery = app.load_encodings()
+    stale = (gallery.version[0] - 1, gallery.version[1])
+    assert not app.gallery_snapshot.append('SNAP-W', 'SNAP-W', [encoding(4)],
+                                           (gallery.version[0] + 1, gallery.version[1] + 1), stale)
+
+
+def test_append_leaves_other_mappings_intact():
+    enroll(app.load_encodings(), 'SNAP-R', 5)
+    worker_a = app.load_encodings()
+    worker_b = app.load_encodings()
+    # Same photo again: the template is replaced, which used to rewrite its row in place
+    enroll(worker_a, 'SNAP-R', 6)
+
+    assert worker_b.verify('SNAP-R', encoding(5)) < 1e-3
+    ids, _, matrix = worker_b.export()
+    for probe in (encoding(5), encoding(6)):
+        _, distances = worker_b.distances(probe)
+        live = np.array([student_id is not None for student_id in ids])
+        expected = np.linalg.norm(np.asarray(matrix, dtype=np.float64) - probe, axis=1)
+        assert np.allclose(distances[live], expected[live], atol=1e-3), (distances[live], expected[live])
+        student_id, _, distance = worker_b.best_match(probe)
+        assert abs(distance - worker_b.verify(student_id, probe)) < 1e-3, (student_id, distance)
+
+    restarted = app.load_encodings()
+    assert restarted.verify('SNAP-R', encoding(6)) < 1e-3
+    assert len(restarted.templates_of('SNAP-R')) == 1
@@ -0,0 +1,128 @@
+"""
+test_idempotency.py - Operation ID Replay Check
+
+Starts app.py against a scratch data directory and checks that a retried
+X-Operation-Id runs its handler once, that a retry arriving mid-flight waits
+for the first attempt, and that one ID sent to /api/verify-face and to
+/api/sync/batch keeps a separate response per endpoint.
+
+Run with: pytest test_idempotency.py
+"""
+
+import asyncio
+import sqlite3
+
+import cv2
+import numpy as np
+
+import app
+from fastapi.testclient import TestClient
+
+client = TestClient(app.app)
+FRAME = cv2.imencode('.jpg', np.random.default_rng(0).integers(0, 256, (480, 640, 3), dtype=np.uint8))[1].tobytes()
+
+
+def counting_handler(calls: list, delay: float = 0):
+    async def handler():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return {"success": True, "attempt": len(calls)}
+    return handler
+
+
+def verify(operation_id: str):
+    return client.post('/api/verify-face', params={"studentId": "20221CIT0043", "studentName": "Amrutha M"},
+                       content=FRAME, headers={"content-type": "image/jpeg", "X-Operation-Id": operation_id})
+
+
+def sync(operation_id: str, student_id: str = "20221CIT0049"):
+    return client.post('/api/sync/batch', json={"operations": [{
+        "id": operation_id, "type": "create", "entity": "attendance",
+        "data": {"studentId": student_id, "date": "2026-01-05", "checkInTime": "08:10:00"}
+    }]})
+
+
+def test_replay_runs_handler_once():
+    calls = []
+
+    async def run():
+        first = await app.run_idempotent(app.VERIFY_FACE_SCOPE, 'replay-1', counting_handler(calls))
+        second = await app.run_idempotent(app.VERIFY_FACE_SCOPE, 'replay-1', counting_handler(calls))
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert len(calls) == 1, calls
+    assert "replayed" not in first and second == {**first, "replayed": True}, (first, second)
+
+
+def test_retry_waits_for_in_flight_attempt():
+    calls = []
+
+    async def run():
+        handler = counting_handler(calls, delay=0.05)
+        return await asyncio.gather(*(
+            app.run_idempotent(app.VERIFY_FACE_SCOPE, 'in-flight-1', handler) for _ in range(3)
+        ))
+
+    responses = asyncio.run(run())
+    assert len(calls) == 1, calls
+    assert sum(1 for response in responses if response.get("replayed")) == 2, responses
+
+
+def test_scopes_keep_separate_responses():
+    calls = []
+
+    async def run():
+        await app.run_idempotent(app.VERIFY_FACE_SCOPE, 'shared-1', counting_handler(calls))
+        return await app.run_idempotent(app.SYNC_BATCH_SCOPE, 'shared-1', counting_handler(calls))
+
+    response = asyncio.run(run())
+    assert len(calls) == 2 and "replayed" not in response, (calls, response)
+
+
+def test_verify_id_reused_by_sync_batch():
+    response = verify('cross-1')
+    assert response.status_code == 200 and "verified" in response.json(), response.text
+
+    response = sync('cross-1')
+    assert response.status_code == 200, response.text
+    result = response.json()["results"][0]
+    assert result["id"] == 'cross-1' and result["status"] in (201, 409), result
+    assert not result.get("replayed"), result
+
+
+def test_sync_id_reused_by_verify():
+    response = sync('cross-2', student_id="20221CIT0151")
+    assert response.status_code == 200, response.text
+
+    response = verify('cross-2')
+    body = response.json()
+    assert response.status_code == 200 and "verified" in body and "id" not in body, body
+    assert not body.get("replayed"), body
+
+
+def test_sync_replay_answered_from_memory():
+    first = sync('memory-1', student_id="20221CIT0152").json()["results"][0]
+    hits = app.idempotency.stats()["hits"]
+
+    replay = sync('memory-1', student_id="20221CIT0152").json()["results"][0]
+    assert replay == {**first, "replayed": True}, (first, replay)
+    assert app.idempotency.stats()["hits"] == hits + 1, app.idempotency.stats()
+
+
+def test_unscoped_rows_are_migrated():
+    conn = sqlite3.connect(':memory:')
+    cursor = conn.cursor()
+    app.create_tables(cursor)
+    cursor.executemany('INSERT INTO sync_operations (operation_id, status, response) VALUES (?, ?, ?)', [
+        ('old-batch', 201, '{"id": "old-batch", "status": 201}'),
+        ('old-verify', 200, '{"success": true, "verified": true}'),
+        ('taken', 200, '{"success": true, "verified": true}'),
+        (f'{app.VERIFY_FACE_SCOPE}:taken', 200, '{"success": true, "verified": false}')
+    ])
+    app.migrate_schema(cursor)
+    app.migrate_schema(cursor)
+    keys = sorted(row[0] for row in cursor.execute('SELECT operation_id FROM sync_operations'))
+    conn.close()
+    assert keys == [f'{app.SYNC_BATCH_SCOPE}:old-batch', 'taken',
+                    f'{app.VERIFY_FACE_SCOPE}:old-verify', f'{app.VERIFY_FACE_SCOPE}:taken'], keys
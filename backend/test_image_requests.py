@@ -0,0 +1,128 @@
+"""
+test_image_requests.py - Face Endpoint Request Check
+
+Starts app.py against a scratch data directory with the synthetic face
+engine and drives /api/admin/upload-student-photo and /api/verify-face
+through the TestClient: every accepted encoding of the image (multipart
+file part, multipart base64 string, raw body with query fields, JSON), the
+422/400 error shapes, and 1:N identification when no studentId is sent.
+
+Run with: pytest test_image_requests.py
+"""
+
+
+import base64
+
+import cv2
+import numpy as np
+
+import app
+from fastapi.testclient import TestClient
+
+client = TestClient(app.app)
+
+
+def frame(seed: int) -> bytes:
+    pixels = np.random.default_rng(seed).integers(0, 256, (240, 320, 3), dtype=np.uint8)
+    return cv2.imencode('.jpg', pixels)[1].tobytes()
+
+
+def enroll(student_id: str, seed: int):
+    response = client.post('/api/admin/upload-student-photo',
+                           params={"studentId": student_id, "studentName": f"Student {student_id}"},
+                           content=frame(seed), headers={"content-type": "image/jpeg"})
+    assert response.status_code == 200, response.text
+
+
+def data_url(image_bytes: bytes) -> str:
+    return "data:image/jpeg;base64," + base64.b64encode(image_bytes).decode('ascii')
+
+
+def send(path: str, encoding: str, fields: dict, image_bytes: bytes):
+    """POST fields and an image to path in one of the supported request encodings"""
+    if encoding == 'multipart-file':
+        return client.post(path, data=fields, files={"image": ("photo.jpg", image_bytes, "image/jpeg")})
+    if encoding == 'multipart-base64':
+        # A part without a filename arrives as a string, like a FormData field set from a data URL
+        return client.post(path, data=fields, files={"image": (None, data_url(image_bytes))})
+    if encoding == 'raw':
+        return client.post(path, params=fields, content=image_bytes, headers={"content-type": "image/jpeg"})
+    return client.post(path, json={**fields, "image": data_url(image_bytes)})
+
+
+ENCODINGS = ('multipart-file', 'multipart-base64', 'raw', 'json')
+
+
+def test_upload_accepts_every_encoding():
+    for i, encoding in enumerate(ENCODINGS):
+        student_id = f'INTAKE-U{i}'
+        response = send('/api/admin/upload-student-photo', encoding,
+                        {"studentId": student_id, "studentName": f"Student {student_id}", "grade": "7"},
+                        frame(200 + i))
+        body = response.json()
+        assert response.status_code == 200 and body["studentId"] == student_id, (encoding, response.text)
+        face = app.extract_face(frame(200 + i), app.FACE_PIPELINE_SETTINGS)
+        assert app.face_gallery.verify(student_id, face["encoding"]) < 1e-3, encoding
+
+
+def test_verify_accepts_every_encoding():
+    enroll('INTAKE-V', 300)
+    for encoding in ENCODINGS:
+        response = send('/api/verify-face', encoding, {"studentId": 'INTAKE-V', "studentName": "Student INTAKE-V"},
+                        frame(300))
+        body = response.json()
+        assert response.status_code == 200 and body["verified"], (encoding, body)
+        assert body["studentId"] == 'INTAKE-V', (encoding, body)
+
+
+def test_missing_multipart_image_is_422():
+    for path in ('/api/admin/upload-student-photo', '/api/verify-face'):
+        response = client.post(path, data={"studentId": 'INTAKE-M', "studentName": "Student"},
+                               files={"other": ("x.txt", b"x", "text/plain")})
+        assert response.status_code == 422 and response.json()["detail"] == "Missing image file part", response.text
+
+
+def test_missing_fields_are_422_without_input():
+    responses = [
+        # Raw body: the upload's fields come from the query string
+        client.post('/api/admin/upload-student-photo', params={"studentName": "No Id"},
+                    content=frame(400), headers={"content-type": "image/jpeg"}),
+        send('/api/admin/upload-student-photo', 'multipart-file', {"studentId": 'INTAKE-N'}, frame(400)),
+        client.post('/api/verify-face', json={"studentId": 'INTAKE-N'}),
+        client.post('/api/verify-face', content=b'{not json', headers={"content-type": "application/json"})
+    ]
+    for response in responses:
+        assert response.status_code == 422, response.text
+        detail = response.json()["detail"]
+        assert isinstance(detail, list) and detail, detail
+        for error in detail:
+            assert set(error) == {"type", "loc", "msg"}, error
+
+
+def test_bad_images_are_400():
+    for path in ('/api/admin/upload-student-photo', '/api/verify-face'):
+        fields = {"studentId": 'INTAKE-B', "studentName": "Student"}
+        empty = client.post(path, params=fields, content=b'', headers={"content-type": "image/jpeg"})
+        assert empty.status_code == 400 and empty.json()["detail"] == "Invalid image: empty body", empty.text
+
+        garbled = client.post(path, json={**fields, "image": "data:image/jpeg;base64,@@@"})
+        assert garbled.status_code == 400 and garbled.json()["detail"].startswith("Invalid image"), garbled.text
+
+
+def test_verify_without_student_id_identifies():
+    enroll('IDENT-1', 101)
+    enroll('IDENT-2', 102)
+
+    response = client.post('/api/verify-face', content=frame(102), headers={"content-type": "image/jpeg"})
+    body = response.json()
+    assert response.status_code == 200 and body["verified"], body
+    assert body["studentId"] == 'IDENT-2' and body["studentName"] == 'Student IDENT-2', body
+
+
+def test_identify_unknown_face_is_rejected():
+    enroll('IDENT-3', 103)
+
+    response = client.post('/api/verify-face', content=frame(999), headers={"content-type": "image/jpeg"})
+    body = response.json()
+    assert response.status_code == 200 and not body["verified"], body
+    assert body["errorCode"] == 'NO_MATCH', body
@@ -0,0 +1,86 @@
+"""
+test_qr_attendance.py - QR Attendance Check
+
+Drives /api/attendance/tokens and /api/attendance/qr through the TestClient
+with the synthetic face engine: a token marks attendance only for the face
+of the student it names, is used up by the first successful check-in, and
+survives a failed face match.
+
+Run with: pytest test_qr_attendance.py
+"""
+
+import cv2
+import numpy as np
+
+import app
+from fastapi.testclient import TestClient
+
+client = TestClient(app.app)
+
+
+def frame(seed: int) -> bytes:
+    pixels = np.random.default_rng(seed).integers(0, 256, (240, 320, 3), dtype=np.uint8)
+    return cv2.imencode('.jpg', pixels)[1].tobytes()
+
+
+def enroll(student_id: str, seed: int):
+    response = client.post('/api/admin/upload-student-photo',
+                           params={"studentId": student_id, "studentName": f"Student {student_id}"},
+                           content=frame(seed), headers={"content-type": "image/jpeg"})
+    assert response.status_code == 200, response.text
+
+
+def issue(student_id: str) -> str:
+    response = client.post('/api/attendance/tokens', json={"studentId": student_id})
+    assert response.status_code == 200, response.text
+    return response.json()["token"]
+
+
+def check_in(token: str, image_bytes: bytes, **fields) -> dict:
+    response = client.post('/api/attendance/qr', params={"token": token, **fields},
+                           content=image_bytes, headers={"content-type": "image/jpeg"})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_token_is_redeemed_by_matching_face():
+    enroll('QR-1', 501)
+    token = issue('QR-1')
+
+    body = check_in(token, frame(501))
+    assert body["verified"] and body["studentId"] == 'QR-1', body
+    assert not client.post('/api/attendance/tokens/validate', json={"token": token}).json()["valid"]
+
+    again = check_in(token, frame(501))
+    assert not again["verified"] and again["errorCode"] == 'TOKEN_USED', again
+
+
+def test_failed_match_keeps_token():
+    enroll('QR-2', 502)
+    enroll('QR-3', 503)
+    token = issue('QR-2')
+
+    # Someone else's face: no attendance, and the student can still use the token
+    wrong = check_in(token, frame(503))
+    assert not wrong["verified"] and wrong["errorCode"] == 'NO_MATCH', wrong
+    assert client.post('/api/attendance/tokens/validate', json={"token": token}).json()["valid"]
+
+    right = check_in(token, frame(502))
+    assert right["verified"] and right["studentId"] == 'QR-2', right
+
+
+def test_invalid_and_mismatched_tokens_are_rejected():
+    enroll('QR-4', 504)
+    token = issue('QR-4')
+
+    forged = check_in(token[:-2] + ('AA' if not token.endswith('AA') else 'BB'), frame(504))
+    assert not forged["verified"] and forged["errorCode"] == 'INVALID_TOKEN', forged
+
+    mismatched = check_in(token, frame(504), studentId='QR-3')
+    assert not mismatched["verified"] and mismatched["errorCode"] == 'TOKEN_MISMATCH', mismatched
+    assert client.post('/api/attendance/tokens/validate', json={"token": token}).json()["valid"]
+
+
+def test_missing_token_is_422():
+    response = client.post('/api/attendance/qr', content=frame(505), headers={"content-type": "image/jpeg"})
+    assert response.status_code == 422, response.text
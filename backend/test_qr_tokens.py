@@ -0,0 +1,67 @@
+"""
+test_qr_tokens.py - QR Attendance Token Check
+
+Exercises qr_tokens.QRTokenService: signing, expiry, tampering and
+single-use redemption with TTL eviction of the used-token set.
+
+Run with: pytest test_qr_tokens.py
+"""
+
+from qr_tokens import QRTokenService
+
+NOW = 1_700_000_000
+
+
+def make_service(secret=b"test-secret"):
+    return QRTokenService(secret, validity_seconds=60)
+
+
+def test_round_trip():
+    service = make_service()
+    token, expires_at = service.issue("20221CIT0043", "Amrutha M", now=NOW)
+    result = service.validate(token, now=NOW + 1)
+    assert result["ok"], result
+    assert result["studentId"] == "20221CIT0043" and result["studentName"] == "Amrutha M"
+    assert expires_at == NOW + 60
+
+
+def test_expired():
+    service = make_service()
+    token, _ = service.issue("20221CIT0043", "Amrutha M", now=NOW)
+    result = service.validate(token, now=NOW + 60)
+    assert result["reason"] == "token_expired", result
+
+
+def test_tampered_and_foreign():
+    service = make_service()
+    token, _ = service.issue("20221CIT0043", "Amrutha M", now=NOW)
+    payload, signature = token.split(".")
+    forged, _ = service.issue("20221CIT0049", "CM Shalini", now=NOW)
+    assert service.validate(f"{forged.split('.')[0]}.{signature}", now=NOW)["reason"] == "invalid_token"
+    assert make_service(b"other-secret").validate(token, now=NOW)["reason"] == "invalid_token"
+    for garbage in ("", "abc", "a.b.c", "!!!.???", token + "x"):
+        assert service.validate(garbage, now=NOW)["reason"] == "invalid_token", garbage
+
+
+def test_single_use():
+    service = make_service()
+    token, _ = service.issue("20221CIT0043", "Amrutha M", now=NOW)
+    assert service.validate(token, now=NOW)["ok"]
+    assert service.redeem(token, now=NOW + 1)["ok"]
+    assert service.redeem(token, now=NOW + 2)["reason"] == "token_used"
+    assert service.validate(token, now=NOW + 2)["reason"] == "token_used"
+
+    other, _ = service.issue("20221CIT0043", "Amrutha M", now=NOW)
+    assert service.redeem(other, now=NOW + 3)["ok"]
+
+
+def test_used_set_evicts_expired():
+    service = make_service()
+    for offset in range(100):
+        token, _ = service.issue("20221CIT0043", "Amrutha M", now=NOW + offset)
+        assert service.redeem(token, now=NOW + offset)["ok"]
+    assert len(service.used._expiry) == 60
+
+    token, _ = service.issue("20221CIT0043", "Amrutha M", now=NOW + 1000)
+    service.redeem(token, now=NOW + 1000)
+    assert len(service.used._expiry) == 1
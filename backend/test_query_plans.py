@@ -0,0 +1,69 @@
+"""
+test_query_plans.py - Attendance Query Plan Check
+
+Builds the schema in an in-memory database, applies the init_db migrations
+and runs EXPLAIN QUERY PLAN on the report, today-list and today-stats
+queries. Every access to attendance must go through an index: a plain
+table scan or a temporary B-tree sort fails the check.
+
+Run with: pytest test_query_plans.py
+"""
+
+import re
+import sqlite3
+
+import app
+
+TODAY = '2024-01-15'
+
+
+def get_plan(sql, params=()):
+    conn = sqlite3.connect(':memory:')
+    cursor = conn.cursor()
+    app.create_tables(cursor)
+    app.migrate_schema(cursor)
+    rows = cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+    conn.close()
+    return [row[3] for row in rows]
+
+
+def assert_indexed(name, sql, params=()):
+    plan = get_plan(sql, params)
+    print(f"\n🔍 {name}")
+    for step in plan:
+        print(f"   {step}")
+    for step in plan:
+        # "SCAN attendance USING COVERING INDEX ..." walks an index; a bare SCAN reads the table
+        assert not re.match(r'SCAN \w+$', step), f"{name}: table scan in plan: {step}"
+        assert 'TEMP B-TREE' not in step, f"{name}: sort without index in plan: {step}"
+
+
+def test_report_unfiltered():
+    assert_indexed("report (no filters)", *app.build_report_query())
+
+
+def test_report_date_range():
+    assert_indexed("report (date range)", *app.build_report_query('2024-01-01', '2024-01-31'))
+
+
+def test_report_student():
+    assert_indexed("report (student)", *app.build_report_query(student_id='20221CIT0043'))
+
+
+def test_report_student_date_range():
+    assert_indexed("report (student + date range)",
+                   *app.build_report_query('2024-01-01', '2024-01-31', '20221CIT0043'))
+
+
+def test_report_keyset_page():
+    after = ['2024-01-15', '08:30:00', 42]
+    assert_indexed("report (keyset page)", *app.build_report_query('2024-01-01', None, None, after, 100))
+    assert_indexed("report (student keyset page)", *app.build_report_query(None, None, '20221CIT0043', after, 100))
+
+
+def test_today_list():
+    assert_indexed("today-list", app.TODAY_LIST_QUERY, (TODAY,))
+
+
+def test_today_stats():
+    assert_indexed("today-stats", app.TODAY_STATS_QUERY, (TODAY,))
@@ -0,0 +1,89 @@
+"""
+test_sync_batch.py - Offline Sync Transaction Check
+
+Runs app.apply_sync_batch against a scratch data directory with hand-built
+plans and checks the per-operation results: creates and deletes apply in
+queue order inside the batch, conflicts come back as 409 with the server's
+record, unknown students and rows as 404, and a replayed batch returns the
+stored results without touching attendance again.
+
+Run with: pytest test_sync_batch.py
+"""
+
+import app
+
+DAY = '2026-02-02'
+
+
+def add_student(student_id: str, name: str):
+    with app.db_pool.connection() as conn:
+        conn.execute('INSERT OR IGNORE INTO students (student_id, name) VALUES (?, ?)', (student_id, name))
+        conn.commit()
+
+
+def attendance_rows(student_id: str) -> list:
+    with app.db_pool.connection() as conn:
+        return [tuple(row) for row in conn.execute(
+            'SELECT date, check_in_time, method FROM attendance WHERE student_id = ? ORDER BY date', (student_id,)
+        )]
+
+
+def plan(action: str, student_id: str, check_in_time: str = '08:10:00') -> dict:
+    return {"action": action, "student_id": student_id, "date": DAY,
+            "check_in_time": check_in_time, "method": 'offline_sync', "confidence": None}
+
+
+def test_second_create_conflicts_with_first():
+    add_student('SYNC-1', 'Sync One')
+    results = app.apply_sync_batch({
+        'conflict-a': plan('create', 'SYNC-1', '08:10:00'),
+        'conflict-b': plan('create', 'SYNC-1', '08:20:00')
+    })
+    assert results['conflict-a']['status'] == 201, results
+    assert results['conflict-b']['status'] == 409, results
+    assert results['conflict-b']['remote'] == results['conflict-a']['record'], results
+    assert results['conflict-b']['remote'] == {
+        "studentId": 'SYNC-1', "studentName": 'Sync One', "date": DAY,
+        "checkInTime": '08:10:00', "method": 'offline_sync', "confidenceScore": None
+    }, results
+    assert attendance_rows('SYNC-1') == [(DAY, '08:10:00', 'offline_sync')]
+
+
+def test_create_then_delete_cancels_out():
+    add_student('SYNC-2', 'Sync Two')
+    results = app.apply_sync_batch({
+        'cancel-a': plan('create', 'SYNC-2'),
+        'cancel-b': plan('delete', 'SYNC-2'),
+        'cancel-c': plan('create', 'SYNC-2', '09:00:00')
+    })
+    assert [results[op_id]['status'] for op_id in ('cancel-a', 'cancel-b', 'cancel-c')] == [201, 200, 201], results
+    assert attendance_rows('SYNC-2') == [(DAY, '09:00:00', 'offline_sync')]
+
+
+def test_unknown_student_and_row_are_not_found():
+    add_student('SYNC-3', 'Sync Three')
+    results = app.apply_sync_batch({
+        'missing-a': plan('create', 'SYNC-UNKNOWN'),
+        'missing-b': plan('delete', 'SYNC-3')
+    })
+    assert results['missing-a']['status'] == 404 and results['missing-a']['errorCode'], results
+    assert results['missing-b']['status'] == 404 and results['missing-b']['errorCode'], results
+    assert attendance_rows('SYNC-UNKNOWN') == [] and attendance_rows('SYNC-3') == []
+
+
+def test_replayed_batch_returns_stored_results():
+    add_student('SYNC-4', 'Sync Four')
+    first = app.apply_sync_batch({'replay-a': plan('create', 'SYNC-4')})
+    app.apply_sync_batch({'replay-b': plan('delete', 'SYNC-4')})
+    again = app.apply_sync_batch({'replay-a': plan('create', 'SYNC-4'), 'replay-b': plan('delete', 'SYNC-4')})
+    assert again['replay-a'] == {**first['replay-a'], "replayed": True}, again
+    assert again['replay-b']['status'] == 200 and again['replay-b']['replayed'], again
+    assert attendance_rows('SYNC-4') == []
+
+
+def test_retryable_results_are_not_stored():
+    busy = {"result": app.sync_result('busy-a', 503, "image_rejected", "Server busy")}
+    assert app.apply_sync_batch({'busy-a': busy})['busy-a']['status'] == 503
+    add_student('SYNC-5', 'Sync Five')
+    results = app.apply_sync_batch({'busy-a': plan('create', 'SYNC-5')})
+    assert results['busy-a']['status'] == 201 and not results['busy-a'].get('replayed'), results
@@ -0,0 +1,85 @@
+"""
+test_templates.py - Template Eviction Check
+
+Runs app.save_encoding against an in-memory database and checks that a
+student keeps at most FACE_MAX_TEMPLATES templates, that auto-added captures
+are evicted before enrolled photos and never push one out, and that
+re-sending a photo replaces its template instead of adding another.
+
+Run with: pytest test_templates.py
+"""
+
+import sqlite3
+
+import numpy as np
+
+import app
+
+STUDENT = "20221CIT0043"
+
+
+def scratch_cursor():
+    cursor = sqlite3.connect(':memory:').cursor()
+    app.create_tables(cursor)
+    cursor.execute('INSERT INTO students (student_id, name) VALUES (?, ?)', (STUDENT, "Amrutha M"))
+    return cursor
+
+
+def encoding(value: float) -> np.ndarray:
+    return np.full(app.ENCODING_DIM, value)
+
+
+def stored(cursor) -> list:
+    """(first encoding value, source) of every template, oldest first"""
+    return [
+        (float(np.frombuffer(row[0], dtype=np.float64)[0]), row[1])
+        for row in cursor.execute('SELECT encoding, source FROM face_encodings WHERE student_id = ? ORDER BY id',
+                                  (STUDENT,))
+    ]
+
+
+def test_oldest_auto_template_is_evicted_first():
+    cursor = scratch_cursor()
+    limit = app.FACE_MAX_TEMPLATES
+    assert app.save_encoding(cursor, STUDENT, encoding(0), photo_hash='photo-0')
+    for i in range(1, limit):
+        assert app.save_encoding(cursor, STUDENT, encoding(i), source=app.TEMPLATE_AUTO)
+    assert app.save_encoding(cursor, STUDENT, encoding(limit), photo_hash='photo-new')
+
+    templates = stored(cursor)
+    assert len(templates) == limit, templates
+    assert templates[0] == (0, app.TEMPLATE_ENROLLED) and (1, app.TEMPLATE_AUTO) not in templates, templates
+    assert templates[-1] == (limit, app.TEMPLATE_ENROLLED), templates
+
+
+def test_auto_template_never_evicts_enrolled():
+    cursor = scratch_cursor()
+    limit = app.FACE_MAX_TEMPLATES
+    for i in range(limit):
+        assert app.save_encoding(cursor, STUDENT, encoding(i), photo_hash=f'photo-{i}')
+    assert not app.save_encoding(cursor, STUDENT, encoding(limit), source=app.TEMPLATE_AUTO)
+
+    templates = stored(cursor)
+    assert templates == [(i, app.TEMPLATE_ENROLLED) for i in range(limit)], templates
+
+
+def test_enrolled_photos_evict_oldest_enrolled():
+    cursor = scratch_cursor()
+    limit = app.FACE_MAX_TEMPLATES
+    for i in range(limit + 2):
+        assert app.save_encoding(cursor, STUDENT, encoding(i), photo_hash=f'photo-{i}')
+
+    templates = stored(cursor)
+    assert [value for value, _ in templates] == list(range(2, limit + 2)), templates
+
+
+def test_resent_photo_replaces_its_template():
+    cursor = scratch_cursor()
+    limit = app.FACE_MAX_TEMPLATES
+    for i in range(limit):
+        assert app.save_encoding(cursor, STUDENT, encoding(i), photo_hash=f'photo-{i}')
+    for _ in range(3):
+        assert app.save_encoding(cursor, STUDENT, encoding(10), photo_hash='photo-1')
+
+    templates = stored(cursor)
+    assert [value for value, _ in templates] == [i for i in range(limit) if i != 1] + [10], templates
@@ -63,20 +63,21 @@ print("conda install -c conda-forge dlib")
 print("pip install face-recognition")
 print("```")
 
-print("\n🔧 Solution 4: Alternative Face Recognition Libraries")
-print("If dlib continues to fail, consider:")
-print("- OpenCV Face Detection (Haar Cascades)")
-print("- MediaPipe Face Detection")
-print("- FaceNet embeddings")
+print("\n🔧 Solution 4: Use the OpenCV face engine (no dlib needed)")
+print("1. Download face_detection_yunet_2023mar.onnx and face_recognition_sface_2021dec.onnx")
+print("   from https://github.com/opencv/opencv_zoo into backend/models/")
+print("2. Start the backend with FACE_ENGINE=opencv (or leave FACE_ENGINE=auto)")
+print("3. Re-run setup_face_recognition.py so stored encodings come from the same engine")
+print("4. Compare engines on your own photos: python bench_engines.py --photos <dir>")
 
 print("\n" + "=" * 70)
 print("CURRENT WORKAROUND")
 print("=" * 70)
-print("✅ Backend is running in MOCK MODE")
+print("✅ Backend is running with the synthetic face engine")
 print("✅ All API endpoints work")
 print("✅ Database operations work")
 print("✅ Image processing works")
-print("⚠️  Face verification uses mock data")
+print("⚠️  Face verification compares image content, not real faces")
 print("\nThe system will work perfectly for:")
 print("- Frontend integration testing")
 print("- Database operations")
@@ -88,7 +89,7 @@ print("\n" + "=" * 70)
 print("NEXT STEPS")
 print("=" * 70)
 print("1. Try Solution 1 (Visual Studio Build Tools)")
-print("2. If that fails, the mock mode works for development")
+print("2. If that fails, use Solution 4 or the synthetic engine for development")
 print("3. Your backend is ready for frontend integration")
 print("4. API docs available at: http://localhost:8000/docs")
 
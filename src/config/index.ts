@@ -32,6 +32,8 @@ export interface SystemConfig {
     enabled: boolean;
     maxQueueSize: number;
     syncInterval: number; // milliseconds
+    syncBatchSize: number; // operations per /api/sync/batch request; the server allows 1000
+    syncBatchBytes: number; // request body budget per batch, bytes
     conflictResolution: 'last-write-wins' | 'versioned-merge' | 'manual';
     maxStorageSize: number; // bytes
     cleanupInterval: number; // milliseconds
@@ -101,6 +103,8 @@ const defaultConfig: SystemConfig = {
     enabled: true,
     maxQueueSize: 1000,
     syncInterval: 30000, // 30 seconds
+    syncBatchSize: 100,
+    syncBatchBytes: 512 * 1024, // 512KB, a few captured images at a time on 2G
     conflictResolution: 'last-write-wins',
     maxStorageSize: 50 * 1024 * 1024, // 50MB
     cleanupInterval: 3600000 // 1 hour
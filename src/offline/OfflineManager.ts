@@ -19,6 +19,15 @@ export interface SyncOperation {
   conflictResolution?: 'local' | 'remote' | 'merge';
 }
 
+export interface SyncResult {
+  id: string;
+  status: number;
+  errorCode?: string;
+  message?: string;
+  remote?: any;
+  replayed?: boolean;
+}
+
 export interface ConflictResolution {
   operationId: string;
   localData: any;
@@ -37,6 +46,15 @@ export interface SyncStatus {
   storageQuota: number;
 }
 
+/**
+ * A /api/sync/batch request the server answered with a non-2xx status
+ */
+class SyncBatchError extends Error {
+  constructor(public status: number, statusText: string) {
+    super(`Sync failed: ${status} ${statusText}`);
+  }
+}
+
 export class OfflineManager {
   private config = getConfig().offline;
   private db: IDBDatabase | null = null;
@@ -216,6 +234,8 @@ export class OfflineManager {
   
   /**
    * Start sync process
+   * Replays pending operations through /api/sync/batch, in queue order, in
+   * batches that stay under the server's operation limit and a byte budget
    */
   private async startSync(): Promise<void> {
     if (this.syncInProgress || !this.isOnline) return;
@@ -229,48 +249,48 @@ export class OfflineManager {
       for (const operation of pendingOperations) {
         if (operation.retryCount >= 3) {
           operation.status = 'failed';
-          continue;
         }
+      }
+      
+      const batches = this.splitBatches(pendingOperations.filter(op => op.status === 'pending'));
+      while (batches.length > 0) {
+        const batch = batches.shift()!;
+        
+        batch.forEach(op => { op.status = 'syncing'; });
+        await this.saveSyncQueue();
+        this.notifyListeners();
         
+        let results: SyncResult[];
         try {
-          operation.status = 'syncing';
-          await this.saveSyncQueue();
-          this.notifyListeners();
-          
-          await this.syncOperation(operation);
-          
-          operation.status = 'completed';
+          results = await this.syncBatch(batch);
         } catch (error) {
-          operation.retryCount++;
-          operation.status = 'pending';
-          
-          console.warn(`Sync operation failed (attempt ${operation.retryCount}):`, error);
-          
-          if (operation.retryCount >= 3) {
-            operation.status = 'failed';
-            handleError({
-              category: ErrorCategory.SYNC_ERROR,
-              severity: ErrorSeverity.MEDIUM,
-              code: 'SYNC_OPERATION_FAILED',
-              message: `Failed to sync ${operation.entity} after multiple attempts`,
-              technicalMessage: error instanceof Error ? error.message : String(error),
-              userMessage: 'Some data failed to sync. Will retry when connection improves.',
-              suggestedActions: [
-                { type: 'retry', label: 'Retry Now' }
-              ],
-              retryable: true
-            });
+          if (error instanceof SyncBatchError && error.status === 413 && batch.length > 1) {
+            // Too large for the server, not a failure of its operations: send it in halves
+            batch.forEach(op => { op.status = 'pending'; });
+            const half = Math.ceil(batch.length / 2);
+            batches.unshift(batch.slice(0, half), batch.slice(half));
+            continue;
           }
+          console.warn('Sync batch failed:', error);
+          if (error instanceof SyncBatchError && error.status === 413) {
+            // A single operation the server will never accept; retrying cannot help
+            batch[0].status = 'failed';
+          } else {
+            batch.forEach(op => this.retryLater(op, error));
+          }
+          // Later batches stay pending untouched until the next sync
+          await this.saveSyncQueue();
+          return;
         }
         
+        await this.applyResults(batch, results);
+        
+        // Clean up completed operations
+        this.syncQueue = this.syncQueue.filter(op => op.status !== 'completed');
         await this.saveSyncQueue();
         this.notifyListeners();
       }
       
-      // Clean up completed operations
-      this.syncQueue = this.syncQueue.filter(op => op.status !== 'completed');
-      await this.saveSyncQueue();
-      
     } finally {
       this.syncInProgress = false;
       this.notifyListeners();
@@ -278,49 +298,130 @@ export class OfflineManager {
   }
   
   /**
-   * Sync individual operation
+   * Split operations, in order, into batches of at most syncBatchSize
+   * operations and about syncBatchBytes of JSON; an operation larger than
+   * the byte budget travels alone
    */
-  private async syncOperation(operation: SyncOperation): Promise<void> {
-    const endpoint = this.getEndpointForEntity(operation.entity);
+  private splitBatches(operations: SyncOperation[]): SyncOperation[][] {
+    const batches: SyncOperation[][] = [];
+    let batch: SyncOperation[] = [];
+    let bytes = 0;
     
-    const response = await fetch(endpoint, {
-      method: this.getHttpMethodForOperation(operation.type),
+    for (const operation of operations) {
+      const size = JSON.stringify(this.toPayload(operation)).length;
+      if (batch.length > 0 && (batch.length >= this.config.syncBatchSize || bytes + size > this.config.syncBatchBytes)) {
+        batches.push(batch);
+        batch = [];
+        bytes = 0;
+      }
+      batch.push(operation);
+      bytes += size;
+    }
+    if (batch.length > 0) {
+      batches.push(batch);
+    }
+    return batches;
+  }
+  
+  /**
+   * Record the server's per-operation results for one batch
+   */
+  private async applyResults(batch: SyncOperation[], results: SyncResult[]): Promise<void> {
+    const resultsById = new Map(results.map(result => [result.id, result]));
+    for (const operation of batch) {
+      const result = resultsById.get(operation.id);
+      
+      if (!result || result.status >= 500) {
+        this.retryLater(operation, result?.message ?? 'No result for operation');
+      } else if (result.status === 409) {
+        await this.handleConflict(operation, result.remote);
+      } else if (result.status >= 400) {
+        // Rejected outright (unknown student, unsupported entity...); retrying cannot help
+        operation.status = 'failed';
+        console.warn(`Sync operation ${operation.id} rejected:`, result.errorCode, result.message);
+      } else {
+        operation.status = 'completed';
+      }
+    }
+  }
+  
+  /**
+   * The fields of an operation the server needs
+   */
+  private toPayload({ id, type, entity, data, timestamp }: SyncOperation) {
+    return { id, type, entity, data, timestamp };
+  }
+  
+  /**
+   * Send queued operations to the server in one round trip
+   * The server applies them in order, keyed by operation id, so a replayed
+   * batch returns the stored results instead of writing twice
+   */
+  private async syncBatch(operations: SyncOperation[]): Promise<SyncResult[]> {
+    const response = await fetch('/api/sync/batch', {
+      method: 'POST',
       headers: {
         'Content-Type': 'application/json',
-        'X-Offline-Sync': 'true',
-        'X-Operation-Id': operation.id,
-        'X-Timestamp': operation.timestamp
+        'X-Offline-Sync': 'true'
       },
-      body: JSON.stringify(operation.data)
+      body: JSON.stringify({
+        operations: operations.map(operation => this.toPayload(operation))
+      })
     });
     
     if (!response.ok) {
-      if (response.status === 409) {
-        // Conflict detected
-        await this.handleConflict(operation, response);
-      } else {
-        throw new Error(`Sync failed: ${response.status} ${response.statusText}`);
-      }
+      throw new SyncBatchError(response.status, response.statusText);
     }
+    
+    const body = await response.json();
+    return body.results;
   }
   
   /**
-   * Handle sync conflicts
+   * Put an operation back in the queue after a transient failure
    */
-  private async handleConflict(operation: SyncOperation, response: Response): Promise<void> {
-    const remoteData = await response.json();
+  private retryLater(operation: SyncOperation, error: unknown): void {
+    operation.retryCount++;
+    operation.status = 'pending';
+    
+    console.warn(`Sync operation failed (attempt ${operation.retryCount}):`, error);
     
+    if (operation.retryCount >= 3) {
+      operation.status = 'failed';
+      handleError({
+        category: ErrorCategory.SYNC_ERROR,
+        severity: ErrorSeverity.MEDIUM,
+        code: 'SYNC_OPERATION_FAILED',
+        message: `Failed to sync ${operation.entity} after multiple attempts`,
+        technicalMessage: error instanceof Error ? error.message : String(error),
+        userMessage: 'Some data failed to sync. Will retry when connection improves.',
+        suggestedActions: [
+          { type: 'retry', label: 'Retry Now' }
+        ],
+        retryable: true
+      });
+    }
+  }
+  
+  /**
+   * Handle sync conflicts
+   */
+  private async handleConflict(operation: SyncOperation, remoteData: any): Promise<void> {
     switch (this.config.conflictResolution) {
       case 'last-write-wins':
         // Use remote data (server wins)
         operation.conflictResolution = 'remote';
+        operation.status = 'completed';
         break;
         
       case 'versioned-merge':
-        // Attempt to merge data
+        // Attempt to merge data; the merged write is a new operation, since the
+        // server has already recorded the conflict under the old id
         const mergedData = await this.mergeData(operation.data, remoteData);
         operation.data = mergedData;
         operation.conflictResolution = 'merge';
+        operation.id = this.generateOperationId();
+        operation.status = 'pending';
         break;
         
       case 'manual':
@@ -329,9 +430,6 @@ export class OfflineManager {
         operation.status = 'failed';
         return;
     }
-    
-    // Retry sync with resolved data
-    await this.syncOperation(operation);
   }
   
   /**
@@ -366,33 +464,6 @@ export class OfflineManager {
     await store.add(conflict);
   }
   
-  /**
-   * Get endpoint for entity type
-   */
-  private getEndpointForEntity(entity: string): string {
-    const endpoints = {
-      attendance: '/api/attendance',
-      student: '/api/students',
-      face_encoding: '/api/face-encodings',
-      notification: '/api/notifications'
-    };
-    
-    return endpoints[entity as keyof typeof endpoints] || '/api/sync';
-  }
-  
-  /**
-   * Get HTTP method for operation type
-   */
-  private getHttpMethodForOperation(type: string): string {
-    const methods = {
-      create: 'POST',
-      update: 'PUT',
-      delete: 'DELETE'
-    };
-    
-    return methods[type as keyof typeof methods] || 'POST';
-  }
-  
   /**
    * Get current sync status
    */